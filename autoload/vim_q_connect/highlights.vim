@@ -16,68 +16,81 @@ function! vim_q_connect#highlights#highlight_text(params)
     endif
     
     call vim_q_connect#virtual_text#init_prop_types()
-    
-    " Get parameters
-    let start_line = get(a:params, 'start_line', 0)
-    let end_line = get(a:params, 'end_line', start_line)
-    let start_col = get(a:params, 'start_col', 1)
-    let end_col = get(a:params, 'end_col', -1)
-    let color = get(a:params, 'color', 'yellow')
-    let virtual_text = get(a:params, 'virtual_text', '')
-    
-    " Validate parameters
-    if start_line <= 0 || start_line > line('$')
-      return
-    endif
-    if end_line <= 0 || end_line > line('$')
-      let end_line = start_line
-    endif
-    if end_col == -1
-      let end_col = len(getline(end_line)) + 1
-    endif
-    
-    " Build property type name
-    let prop_type = 'q_highlight_' . color
-    
-    " Generate unique ID for this property
-    let prop_id = s:next_highlight_id
-    let s:next_highlight_id += 1
-    
-    " Create text property
-    let prop_options = {'type': prop_type, 'id': prop_id}
-    if end_line > start_line
-      let prop_options.end_lnum = end_line
-      let prop_options.end_col = end_col + 1
-    elseif end_col > start_col && end_col <= len(getline(start_line)) + 1
-      " Single line partial highlight (inclusive of end column)
-      let prop_options.length = end_col - start_col + 1
-    endif
-    
-    " Add the property
-    call prop_add(start_line, start_col, prop_options)
-    
-    " Store start line for this prop ID (for virtual text placement)
-    let s:highlight_start_lines[prop_id] = start_line
-    
-    " Store virtual text and color in script-local dicts if provided
-    if !empty(virtual_text)
-      let s:highlight_virtual_text[prop_id] = virtual_text
-      let s:highlight_colors[prop_id] = color
-    endif
-    
+    call s:add_highlight(a:params)
   catch
     " Silent error handling
   endtry
 endfunction
 
+" Internal: Add one highlight; caller has checked textprop and set up prop types
+function! s:add_highlight(params)
+  " Get parameters
+  let start_line = get(a:params, 'start_line', 0)
+  let end_line = get(a:params, 'end_line', start_line)
+  let start_col = get(a:params, 'start_col', 1)
+  let end_col = get(a:params, 'end_col', -1)
+  let color = get(a:params, 'color', 'yellow')
+  let virtual_text = get(a:params, 'virtual_text', '')
+  
+  " Validate parameters
+  if start_line <= 0 || start_line > line('$')
+    return
+  endif
+  if end_line <= 0 || end_line > line('$')
+    let end_line = start_line
+  endif
+  if end_col == -1
+    let end_col = len(getline(end_line)) + 1
+  endif
+  
+  " Build property type name
+  let prop_type = 'q_highlight_' . color
+  
+  " Generate unique ID for this property
+  let prop_id = s:next_highlight_id
+  let s:next_highlight_id += 1
+  
+  " Create text property
+  let prop_options = {'type': prop_type, 'id': prop_id}
+  if end_line > start_line
+    let prop_options.end_lnum = end_line
+    let prop_options.end_col = end_col + 1
+  elseif end_col > start_col && end_col <= len(getline(start_line)) + 1
+    " Single line partial highlight (inclusive of end column)
+    let prop_options.length = end_col - start_col + 1
+  endif
+  
+  " Add the property
+  call prop_add(start_line, start_col, prop_options)
+  
+  " Store start line for this prop ID (for virtual text placement)
+  let s:highlight_start_lines[prop_id] = start_line
+  
+  " Store virtual text and color in script-local dicts if provided
+  if !empty(virtual_text)
+    let s:highlight_virtual_text[prop_id] = virtual_text
+    let s:highlight_colors[prop_id] = color
+  endif
+endfunction
+
 " Highlight multiple text regions
 function! vim_q_connect#highlights#highlight_text_batch(entries)
   try
+    if !has('textprop')
+      return
+    endif
+    
+    " Set up prop types once for the whole batch, not per entry
+    call vim_q_connect#virtual_text#init_prop_types()
     for entry in a:entries
       if !has_key(entry, 'start_line')
         continue
       endif
-      call vim_q_connect#highlights#highlight_text(entry)
+      try
+        call s:add_highlight(entry)
+      catch
+        " Skip this entry; keep going with the rest of the batch
+      endtry
     endfor
   catch
     " Silent error handling
@@ -115,6 +115,12 @@ function! vim_q_connect#mcp#handle_mcp_message(channel, msg)
     else
       call timer_start(0, {-> vim_q_connect#highlights#highlight_text(params)})
     endif
+  elseif data.method == 'highlight_text_batch'
+    if !has_key(data, 'params') || !has_key(data.params, 'entries')
+      return
+    endif
+    let entries = data.params.entries
+    call timer_start(0, {-> vim_q_connect#highlights#highlight_text_batch(entries)})
   elseif data.method == 'clear_highlights'
     let filename = get(data.params, 'filename', '')
     call timer_start(0, {-> vim_q_connect#highlights#do_clear_highlights(filename)})
@@ -2,14 +2,21 @@
 MCP tools for annotations and highlights in the editor.
 """
 
-import json
 import logging
-import queue
-import uuid
 from typing import Any, Dict, Optional
 
+import json_codec
+from config import RESPONSE_TIMEOUT
+from vim_state import encode_batch
+
 logger = logging.getLogger("vim-context")
 
+# Clearing the current buffer is the common case; build that request once
+_CLEAR_ANNOTATIONS_CURRENT = (
+    "clear_annotations",
+    {"method": "clear_annotations", "params": {"filename": None}},
+)
+
 
 def add_virtual_text(vim_state: Any, entries: list[Dict[str, Any]]) -> str:
     """Add multiple virtual text entries efficiently to annotate the user's file in their editor.
@@ -28,31 +35,33 @@ def add_virtual_text(vim_state: Any, entries: list[Dict[str, Any]]) -> str:
         entries: List of dictionaries, each containing:
             - line (str): Exact text content of the line to search for. Use this line argument in preference to line_number because it's more robust - annotations stay correct even if line numbers shift due to edits.
             - line_number (int): Alternative to line. 1-indexed line number to add virtual text above. Don't use the line_number argument unless the line is absolutely known, e.g. from an immediately preceding get_editor_context tool call.
-            - text (str): The annotation text to display (supports multi-line with \n). Any emoji characters at the beginning will be extracted and consumed.
+            - text (str): The annotation text to display (supports multi-line with \\n). Any emoji characters at the beginning will be extracted and consumed.
             - highlight (str, optional): Vim highlight group (ignored for now - will always uses qtext styling)
             - emoji (str, optional): Single emoji character for visual emphasis. If provided, this takes precedence over any emoji extracted from text. Any emoji at the beginning of text will still be consumed. (defaults to Ｑ)
     """
 
-    if not vim_state.is_connected():
+    if not vim_state.connected:
         return "Vim not connected to MCP socket"
 
-    try:
-        logger.info(f"Adding batch virtual text: {len(entries)} entries")
+    # Nothing to draw; don't wake the socket thread for an empty batch
+    if not entries:
+        return "Batch virtual text added: 0 entries"
+
+    logger.info("Adding batch virtual text: %d entries", len(entries))
+    # Skip the per-entry loop entirely unless DEBUG output is wanted
+    if logger.isEnabledFor(logging.DEBUG):
         for i, entry in enumerate(entries):
-            logger.debug(f"Entry {i}: {entry}")
+            logger.debug("Entry %d: %s", i, entry)
 
-        vim_state.request_queue.put(
-            (
-                "add_virtual_text_batch",
-                {"method": "add_virtual_text_batch", "params": {"entries": entries}},
-            )
-        )
+    # Encode here, on the tool thread, so the socket thread only writes bytes
+    payload = encode_batch("add_virtual_text_batch", entries)
+    if not vim_state.enqueue_request(("add_virtual_text_batch", payload)):
+        return "Vim not connected to MCP socket"
 
-        logger.info("Successfully queued batch virtual text command")
-        return f"Batch virtual text added: {len(entries)} entries"
-    except Exception as e:
-        logger.error(f"Error sending batch virtual text command: {e}")
-        return f"Error sending batch virtual text command: {e}"
+    vim_state.invalidate_annotations()
+
+    logger.info("Successfully queued batch virtual text command")
+    return f"Batch virtual text added: {len(entries)} entries"
 
 
 def get_annotations_above_current_position(vim_state: Any) -> str:
@@ -65,35 +74,51 @@ def get_annotations_above_current_position(vim_state: Any) -> str:
         JSON string containing list of annotations with their text content and metadata
     """
 
-    if not vim_state.is_connected():
+    if not vim_state.connected:
         return "Vim not connected to MCP socket"
 
+    # Recent results are reused while the cursor stays put, keyed on the
+    # position from the last context update
+    context = vim_state.get_context()
+    cache_key = (context["filename"], context["line"], context["total_lines"])
+    cached, generation = vim_state.cached_annotations(cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        # Create unique request ID and response queue
-        request_id = str(uuid.uuid4())
-        response_queue: queue.Queue = queue.Queue()
-        vim_state.response_queues[request_id] = response_queue
-
-        # Put request in queue for server thread to send
-        vim_state.request_queue.put(
-            (
-                "get_annotations",
-                {"method": "get_annotations", "request_id": request_id, "params": {}},
-            )
-        )
+        # Create unique request ID and response slot
+        request_id, pending = vim_state.register_response()
 
-        # Wait for response
+        # Release the slot even if the request can't be queued
         try:
-            response_type, annotations = response_queue.get(timeout=5.0)
+            # Put request in queue for server thread to send
+            vim_state.request_queue.put(
+                (
+                    "get_annotations",
+                    {
+                        "method": "get_annotations",
+                        "request_id": request_id,
+                        "params": {},
+                    },
+                )
+            )
+
+            # Wait for response
+            if not pending.event.wait(timeout=RESPONSE_TIMEOUT):
+                return "Timeout waiting for annotations response"
+            response_type, annotations = pending.result
             if response_type == "annotations":
-                return json.dumps(annotations)
+                # Compact, non-escaped JSON: fewer bytes and tokens for the client
+                payload = json_codec.dumps_str(annotations)
+                vim_state.store_annotations(cache_key, generation, payload)
+                return payload
+            elif response_type == "disconnected":
+                return "Vim disconnected before sending annotations"
             else:
                 return f"Unexpected response type: {response_type}"
-        except queue.Empty:
-            return "Timeout waiting for annotations response"
         finally:
-            # Clean up response queue
-            del vim_state.response_queues[request_id]
+            # Clean up response slot
+            vim_state.release_response(request_id)
 
     except Exception as e:
         logger.error(f"Error requesting annotations: {e}")
@@ -115,19 +140,17 @@ def clear_annotations(vim_state: Any, filename: Optional[str] = None) -> str:
         Status message indicating success or failure
     """
 
-    if not vim_state.is_connected():
-        return "Vim not connected to MCP socket"
-
-    try:
-        vim_state.request_queue.put(
-            (
-                "clear_annotations",
-                {"method": "clear_annotations", "params": {"filename": filename}},
-            )
+    request = (
+        _CLEAR_ANNOTATIONS_CURRENT
+        if filename is None
+        else (
+            "clear_annotations",
+            {"method": "clear_annotations", "params": {"filename": filename}},
         )
+    )
+    if not vim_state.enqueue_clear(request, filename):
+        return "Vim not connected to MCP socket"
+    vim_state.invalidate_annotations()
 
-        target = f"from {filename}" if filename else "from current buffer"
-        return f"Cleared all annotations {target}"
-    except Exception as e:
-        logger.error(f"Error sending clear annotations command: {e}")
-        return f"Error sending clear annotations command: {e}"
+    target = f"from {filename}" if filename else "from current buffer"
+    return f"Cleared all annotations {target}"
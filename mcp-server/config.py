@@ -2,22 +2,48 @@
 Configuration and logging setup for MCP server.
 """
 
+import atexit
 import os
 import logging
+import logging.handlers
+import queue
+
+# Environment is read once at import; later changes need a process restart
+_LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+_LOG_FILE = os.environ.get("LOG_FILE")
+
+# Seconds a tool waits for Vim to answer a request before giving up
+RESPONSE_TIMEOUT = float(os.environ.get("VIMQ_RESPONSE_TIMEOUT", "1.0"))
+
+_LOGGING_CONFIGURED = False
 
 
 def setup_logging():
-    """Configure logging for the MCP server."""
-    log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
-    log_file = os.environ.get("LOG_FILE")
-    log_config = {
-        "level": getattr(logging, log_level, logging.INFO),
-        "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    }
-    if log_file:
-        log_config.update({"filename": log_file, "filemode": "a"})
-    logging.basicConfig(**log_config)
-    return logging.getLogger("vim-context")
+    """Configure logging for the MCP server.
 
+    Called by main.py when the server starts, not on import, so importing a
+    tool module for RESPONSE_TIMEOUT starts no listener thread. Safe to call
+    more than once; only the first call configures handlers.
+    """
+    global _LOGGING_CONFIGURED
+    if _LOGGING_CONFIGURED:
+        return logging.getLogger("vim-context")
 
-logger = setup_logging()
+    # Records are handed to a background listener so the socket threads never
+    # block on stderr or file writes.
+    if _LOG_FILE:
+        handler = logging.FileHandler(_LOG_FILE, mode="a")
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    )
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, _LOG_LEVEL, logging.INFO))
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _LOGGING_CONFIGURED = True
+    return logging.getLogger("vim-context")
@@ -5,8 +5,19 @@ MCP tools for highlights in the editor.
 import logging
 from typing import Dict, Any, Optional
 
+from vim_state import encode_batch
+
 logger = logging.getLogger("vim-context")
 
+# Clearing the current buffer is the common case; build that request once
+_CLEAR_HIGHLIGHTS_CURRENT = (
+    "clear_highlights",
+    {"method": "clear_highlights", "params": {"filename": None}},
+)
+
+# Highlight colors understood by the Vim plugin (q_highlight_<color> prop types)
+_VALID_COLORS = frozenset(("yellow", "orange", "pink", "green", "blue", "purple"))
+
 
 def highlight_text(vim_state: Any, entries: list[Dict[str, Any]]) -> str:
     """Add multiple background color highlights to code regions with optional hover text.
@@ -28,54 +39,50 @@ def highlight_text(vim_state: Any, entries: list[Dict[str, Any]]) -> str:
         Status message indicating success or failure
     """
 
-    if not vim_state.is_connected():
+    if not vim_state.connected:
         return "Vim not connected to MCP socket"
 
-    valid_colors = ["yellow", "orange", "pink", "green", "blue", "purple"]
+    # Nothing to highlight; don't wake the socket thread for an empty batch
+    if not entries:
+        return "Added 0 highlights"
 
     try:
-        processed = 0
-        for entry in entries:
-            # Validate required fields
-            if "start_line" not in entry:
-                logger.warning(f"Highlight entry missing start_line: {entry}")
-                continue
-
-            start_line = entry["start_line"]
-            end_line = entry.get("end_line", start_line)
-            start_col = entry.get("start_col", 1)
-            end_col = entry.get("end_col", -1)
-            color = entry.get("color", "yellow")
-            virtual_text = entry.get("virtual_text", "")
-
-            # Validate color
-            if color not in valid_colors:
-                logger.warning(f"Invalid highlight color '{color}': {entry}")
-                continue
-
-            vim_state.request_queue.put(
-                (
-                    "highlight_text",
-                    {
-                        "method": "highlight_text",
-                        "params": {
-                            "start_line": start_line,
-                            "end_line": end_line,
-                            "start_col": start_col,
-                            "end_col": end_col,
-                            "color": color,
-                            "virtual_text": virtual_text,
-                        },
-                    },
-                )
-            )
-            processed += 1
-
-        return f"Added {processed} highlights"
-    except Exception as e:
-        logger.error(f"Error sending highlight command: {e}")
+        # Normalize entries with defaults, dropping any without start_line or
+        # with an unknown color
+        valid_entries = [
+            {
+                "start_line": start_line,
+                "end_line": entry.get("end_line", start_line),
+                "start_col": entry.get("start_col", 1),
+                "end_col": entry.get("end_col", -1),
+                "color": color,
+                "virtual_text": entry.get("virtual_text", ""),
+            }
+            for entry in entries
+            if (start_line := entry.get("start_line")) is not None
+            and (color := entry.get("color", "yellow")) in _VALID_COLORS
+        ]
+    except (AttributeError, TypeError) as e:
+        # Entry that isn't a dict, or an unhashable color value
+        logger.error(f"Invalid highlight entries: {e}")
         return f"Error sending highlight command: {e}"
 
+    rejected = len(entries) - len(valid_entries)
+    if rejected:
+        logger.warning(
+            "Skipped %d highlight entries with missing start_line or invalid color",
+            rejected,
+        )
+
+    if valid_entries:
+        # Send all highlights in one message so Vim gets a single frame per
+        # call, encoded here so the socket thread only writes bytes
+        payload = encode_batch("highlight_text_batch", valid_entries)
+        if not vim_state.enqueue_request(("highlight_text_batch", payload)):
+            return "Vim not connected to MCP socket"
+
+    return f"Added {len(valid_entries)} highlights"
+
 
 def clear_highlights(vim_state: Any, filename: Optional[str] = None) -> str:
     """Clear all text highlights from a specific file or current buffer in Vim.
@@ -91,19 +98,16 @@ def clear_highlights(vim_state: Any, filename: Optional[str] = None) -> str:
         Status message indicating success or failure
     """
 
-    if not vim_state.is_connected():
-        return "Vim not connected to MCP socket"
-
-    try:
-        vim_state.request_queue.put(
-            (
-                "clear_highlights",
-                {"method": "clear_highlights", "params": {"filename": filename}},
-            )
+    request = (
+        _CLEAR_HIGHLIGHTS_CURRENT
+        if filename is None
+        else (
+            "clear_highlights",
+            {"method": "clear_highlights", "params": {"filename": filename}},
         )
+    )
+    if not vim_state.enqueue_clear(request, filename):
+        return "Vim not connected to MCP socket"
 
-        target = f"from {filename}" if filename else "from current buffer"
-        return f"Cleared all highlights {target}"
-    except Exception as e:
-        logger.error(f"Error sending clear highlights command: {e}")
-        return f"Error sending clear highlights command: {e}"
+    target = f"from {filename}" if filename else "from current buffer"
+    return f"Cleared all highlights {target}"
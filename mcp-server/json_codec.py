@@ -0,0 +1,41 @@
+"""
+JSON encoding and decoding for the Vim socket protocol.
+
+Uses orjson (a project dependency; native parser/serializer that produces
+bytes directly) and falls back to the standard library json module when it is
+not installed, e.g. when only fastmcp was installed with pip.
+"""
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers can
+# catch json.JSONDecodeError with either backend.
+JSONDecodeError = json.JSONDecodeError
+
+if orjson is not None:
+    loads = orjson.loads
+
+    def dumps(obj: Any) -> bytes:
+        """Serialize obj to compact UTF-8 JSON bytes."""
+        return orjson.dumps(obj)
+
+    def dumps_str(obj: Any) -> str:
+        """Serialize obj to compact, non-ASCII-escaped JSON text."""
+        return orjson.dumps(obj).decode("utf-8")
+
+else:
+    loads = json.loads
+
+    def dumps(obj: Any) -> bytes:
+        """Serialize obj to compact UTF-8 JSON bytes."""
+        return dumps_str(obj).encode("utf-8")
+
+    def dumps_str(obj: Any) -> str:
+        """Serialize obj to compact, non-ASCII-escaped JSON text."""
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
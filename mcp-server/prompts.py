@@ -2,40 +2,28 @@
 MCP prompt implementations for code review, explanation, fixing, and documentation.
 """
 
-import uuid
-import queue
 import logging
-from typing import Any, Optional
-
-logger = logging.getLogger("vim-context")
-
-
-def review_prompt(vim_state: Any, target: Optional[str] = None) -> str:
-    """Review the code for quality, security, and best practices"""
-
-    try:
-        prompt = ""
+import queue
+from traceback import format_exc
+from typing import Any, Dict, Optional, Tuple
 
-        if vim_state.is_connected():
-            context = vim_state.get_context()
-            prompt += "Current context:\n"
-            prompt += f"File: {context['filename']}\n"
-            prompt += f"Line: {context['line']}\n"
+from config import RESPONSE_TIMEOUT
 
-            if context.get("visual_start", 0) > 0:
-                prompt += f"Selection: lines {context['visual_start']}-{context['visual_end']}\n"
+logger = logging.getLogger("vim-context")
 
-        prompt += "Please review the code for issues."
-        if target is not None:
-            prompt += (
-                f"The user has specifically asked for this to be reviewed: {target}"
-            )
-        elif vim_state.is_connected():
-            prompt += "Use the context above to determine what should be reviewed. If they have a current selection, that is the most important thing."
+_CONTEXT_INTRO = "Current context:\n"
+_CONTEXT_INTRO_EDITOR = "Current context (from get_editor_context tool, only call the tool if you require additional context):\n"
+_USE_PROVIDED_CONTEXT = "IMPORTANT: Do not call get_editor_context - the context provided above is current and up-to-date.\n\n"
 
-        prompt += "\n\nFor the code they have asked for a review for:"
+# Seconds to wait for Vim to report the current quickfix entry: never longer
+# than the tools' RESPONSE_TIMEOUT, and capped because the prompt is blocked
+# until Vim answers
+_QUICKFIX_TIMEOUT = min(0.5, RESPONSE_TIMEOUT)
 
-        prompt += """
+# Static instruction blocks, built once at import
+_REVIEW_TAIL = (
+    "\n\nFor the code they have asked for a review for:"
+    """
 1. Check for security vulnerabilities
 2. Check for code quality issues
 3. Check for performance problems
@@ -55,47 +43,9 @@ Examples of good quickfix entries:
 - "🧹 QUALITY: Missing error handling\nUnhandled exceptions can crash the application\nAdd try-catch blocks with appropriate error responses"
 
 The user will navigate through issues using :cnext/:cprev in Vim and can use the @fix prompt to fix individual issues."""
+)
 
-        return prompt
-
-    except Exception as e:
-        import traceback
-
-        error_details = "ERROR in review prompt:\n"
-        error_details += f"Exception type: {type(e).__name__}\n"
-        error_details += f"Exception message: {str(e)}\n"
-        error_details += f"Traceback:\n{traceback.format_exc()}\n"
-        error_details += f"Function arguments: target={target}\n"
-        if vim_state.is_connected():
-            error_details += "Vim connected: True\n"
-        return error_details
-
-
-def explain_prompt(vim_state: Any, target: Optional[str] = None) -> str:
-    """Explain what the current code does by adding detailed annotations
-
-    Provides comprehensive explanations as inline annotations using add_virtual_text,
-    with overview and detailed technical explanations for senior developers.
-    """
-    try:
-        prompt = ""
-
-        if vim_state.is_connected():
-            context = vim_state.get_context()
-            prompt += "Current context (from get_editor_context tool, only call the tool if you require additional context):\n"
-            prompt += f"File: {context['filename']}\n"
-            prompt += f"Line: {context['line']}\n"
-
-            if context.get("visual_start", 0) > 0:
-                prompt += f"Selection: lines {context['visual_start']}-{context['visual_end']}\n\n"
-
-        prompt += "Please explain the code by adding detailed annotations directly to the editor."
-        if target is not None:
-            prompt += f" The user has specifically asked about: {target}"
-        elif vim_state.is_connected():
-            prompt += " Use the context above to determine what should be explained. If they have a current selection, that is the most important thing."
-
-        prompt += """
+_EXPLAIN_STEPS = """
 
 Steps:
 1. Analyse the code. If understanding it properly requires examining other code, then find and understand that code too.
@@ -103,11 +53,7 @@ Steps:
 
 """
 
-        # Only add the instruction if we have context from vim_state
-        if vim_state.is_connected():
-            prompt += "IMPORTANT: Do not call get_editor_context - the context provided above is current and up-to-date.\n\n"
-
-        prompt += """Annotation Guidelines:
+_EXPLAIN_GUIDELINES = """Annotation Guidelines:
 - Start with an OVERVIEW annotation using ℹ️ emoji for cases where there is a
   function/method/class etc, or a section being explained
 - Add detailed annotations using 💬 emoji for each significant line or block
@@ -131,79 +77,41 @@ Make the explanations comprehensive enough that a senior developer could underst
 - Implementation details and technical considerations
 - Potential issues, edge cases, or areas for improvement"""
 
-        return prompt
+_ADD_DOC = """
 
-    except Exception as e:
-        import traceback
+Add:
+1. Docstrings for functions/classes (following language conventions)
+2. Inline comments for complex logic
+3. Type hints (if applicable)
+4. Usage examples (if helpful)
 
-        error_details = "ERROR in explain prompt:\n"
-        error_details += f"Exception type: {type(e).__name__}\n"
-        error_details += f"Exception message: {str(e)}\n"
-        error_details += f"Traceback:\n{traceback.format_exc()}\n"
-        error_details += f"Function arguments: target={target}\n"
-        if vim_state.is_connected():
-            error_details += "Vim connected: True\n"
-        return error_details
+Make the documentation:
+- Clear and concise
+- Focused on "why" not just "what"
+- Helpful for future maintainers
 
+Make sure to understand what the code does, and if other parts of the codebase
+will assist with that, read and understand them as well.
+"""
 
-def fix_prompt(vim_state: Any, target: Optional[str] = None) -> str:
-    """Fix issues in code or the current quickfix issue"""
+_FIX_CRITERIA = """
+- Addresses the root cause, not just the symptom
+- Follows best practices and coding standards
+- Doesn't introduce new issues
+- Is minimal and focused"""
 
-    if target is None:
-        # Check if there's a current quickfix issue
-        if vim_state.is_connected():
-            try:
-                # Create unique request ID and response queue
-                request_id = str(uuid.uuid4())
-                response_queue = queue.Queue()
-                vim_state.response_queues[request_id] = response_queue
-
-                # Put request in queue for server thread to send
-                vim_state.request_queue.put(
-                    (
-                        "get_current_quickfix",
-                        {
-                            "method": "get_current_quickfix",
-                            "request_id": request_id,
-                            "params": {},
-                        },
-                    )
-                )
-
-                # Wait for response
-                try:
-                    response_type, data = response_queue.get(timeout=2.0)
-                    if (
-                        response_type == "quickfix_entry"
-                        and "error" not in data
-                        and "text" in data
-                    ):
-                        # We have a valid quickfix entry
-                        issue_text = data.get("text", "").split("\n")[
-                            0
-                        ]  # First line only
-                        return f"""Please fix the current quickfix issue: {issue_text}
-
-The issue is at {data.get("filename", "unknown file")}:{data.get("line_number", 0)}
+# Appended to the quickfix issue line; only the issue and location vary
+_FIX_QUICKFIX_STEPS = """
 
 Steps:
 1. Read the file and understand the context around the issue
 2. Apply the appropriate fix to resolve this specific issue
 3. Explain what you changed and why
 
-Make sure the fix:
-- Addresses the root cause, not just the symptom
-- Follows best practices and coding standards
-- Doesn't introduce new issues
-- Is minimal and focused"""
-                finally:
-                    # Clean up response queue
-                    vim_state.response_queues.pop(request_id, None)
-            except Exception:
-                pass  # Fall through to editor context
+Make sure the fix:""" + _FIX_CRITERIA
 
-        # No quickfix entry or error - use current editor context
-        return """Please fix the code I'm currently looking at.
+# Whole prompt when there is no target and no usable quickfix entry
+_FIX_FALLBACK = """Please fix the code I'm currently looking at.
 
 Steps:
 1. Use get_editor_context to see what code I'm currently viewing
@@ -211,58 +119,188 @@ Steps:
 3. Apply appropriate fixes to resolve the issues
 4. Explain what you changed and why
 
-Make sure the fix:
-- Addresses the root cause, not just the symptom
-- Follows best practices and coding standards
-- Doesn't introduce new issues
-- Is minimal and focused"""
+Make sure the fix:""" + _FIX_CRITERIA
+
+_FIX_STEPS = """
+
+Steps:
+1. Identify the issues that need fixing
+2. Apply appropriate fixes to resolve each issue
+3. Explain what you changed and why
+
+"""
+
+_FIX_EACH_CRITERIA = "Make sure each fix:" + _FIX_CRITERIA
+
+
+def _prompt_header(
+    vim_state: Any, intro: str, selection_end: str = "\n"
+) -> Tuple[bool, str]:
+    """Return the connection state and a header describing the cursor position.
+
+    Reads the connection flag and the context snapshot once, so callers can
+    reuse the flag instead of asking vim_state again.
+    """
+    if not vim_state.connected:
+        return False, ""
+    context = vim_state.get_context()
+    header = f"{intro}File: {context['filename']}\nLine: {context['line']}\n"
+    if context.get("visual_start", 0) > 0:
+        header += f"Selection: lines {context['visual_start']}-{context['visual_end']}{selection_end}"
+    return True, header
 
+
+def review_prompt(vim_state: Any, target: Optional[str] = None) -> str:
+    """Review the code for quality, security, and best practices"""
+
+    try:
+        connected, prompt = _prompt_header(vim_state, _CONTEXT_INTRO)
+
+        prompt += "Please review the code for issues."
+        if target is not None:
+            prompt += (
+                f"The user has specifically asked for this to be reviewed: {target}"
+            )
+        elif connected:
+            prompt += "Use the context above to determine what should be reviewed. If they have a current selection, that is the most important thing."
+
+        prompt += _REVIEW_TAIL
+
+        return prompt
+
+    except Exception as e:
+        connected = "Vim connected: True\n" if vim_state.connected else ""
+        return (
+            f"ERROR in review prompt:\n"
+            f"Exception type: {type(e).__name__}\n"
+            f"Exception message: {e}\n"
+            f"Traceback:\n{format_exc()}\n"
+            f"Function arguments: target={target}\n"
+            f"{connected}"
+        )
+
+
+def explain_prompt(vim_state: Any, target: Optional[str] = None) -> str:
+    """Explain what the current code does by adding detailed annotations
+
+    Provides comprehensive explanations as inline annotations using add_virtual_text,
+    with overview and detailed technical explanations for senior developers.
+    """
+    try:
+        connected, prompt = _prompt_header(vim_state, _CONTEXT_INTRO_EDITOR, "\n\n")
+
+        prompt += "Please explain the code by adding detailed annotations directly to the editor."
+        if target is not None:
+            prompt += f" The user has specifically asked about: {target}"
+        elif connected:
+            prompt += " Use the context above to determine what should be explained. If they have a current selection, that is the most important thing."
+
+        prompt += _EXPLAIN_STEPS
+
+        # Only add the instruction if we have context from vim_state
+        if connected:
+            prompt += _USE_PROVIDED_CONTEXT
+
+        prompt += _EXPLAIN_GUIDELINES
+
+        return prompt
+
+    except Exception as e:
+        connected = "Vim connected: True\n" if vim_state.connected else ""
+        return (
+            f"ERROR in explain prompt:\n"
+            f"Exception type: {type(e).__name__}\n"
+            f"Exception message: {e}\n"
+            f"Traceback:\n{format_exc()}\n"
+            f"Function arguments: target={target}\n"
+            f"{connected}"
+        )
+
+
+def _try_get_current_qf(vim_state: Any) -> Optional[Dict[str, Any]]:
+    """Ask Vim for the current quickfix entry.
+
+    Returns the entry, or None if Vim can't be asked, doesn't answer within
+    _QUICKFIX_TIMEOUT or reports an error.
+    """
+    try:
+        # Create unique request ID and response slot
+        request_id, pending = vim_state.register_response()
+    except RuntimeError:
+        return None  # Every response slot is taken
+
+    # Release the slot even if the request can't be queued
     try:
-        prompt = ""
+        # Put request in queue for server thread to send
+        vim_state.request_queue.put(
+            (
+                "get_current_quickfix",
+                {
+                    "method": "get_current_quickfix",
+                    "request_id": request_id,
+                    "params": {},
+                },
+            )
+        )
+
+        # Wait for response
+        # Keep this short: the prompt is blocked until Vim answers
+        if not pending.event.wait(timeout=_QUICKFIX_TIMEOUT):
+            return None
+        response_type, data = pending.result
+    except queue.Full:
+        return None
+    finally:
+        # Clean up response slot
+        vim_state.release_response(request_id)
+
+    if response_type != "quickfix_entry" or "error" in data:
+        return None
+    return data
 
-        if vim_state.is_connected():
-            context = vim_state.get_context()
-            prompt += "Current context (from get_editor_context tool, only call the tool if you require additional context):\n"
-            prompt += f"File: {context['filename']}\n"
-            prompt += f"Line: {context['line']}\n"
 
-            if context.get("visual_start", 0) > 0:
-                prompt += f"Selection: lines {context['visual_start']}-{context['visual_end']}\n\n"
+def fix_prompt(vim_state: Any, target: Optional[str] = None) -> str:
+    """Fix issues in code or the current quickfix issue"""
+
+    if target is None:
+        # Check if there's a current quickfix issue
+        qf = _try_get_current_qf(vim_state) if vim_state.connected else None
+        if qf is not None and isinstance(qf.get("text"), str):
+            issue_text = qf["text"].split("\n")[0]  # First line only
+            return (
+                f"Please fix the current quickfix issue: {issue_text}\n\n"
+                f"The issue is at {qf.get('filename', 'unknown file')}:"
+                f"{qf.get('line_number', 0)}" + _FIX_QUICKFIX_STEPS
+            )
+
+        # No quickfix entry or error - use current editor context
+        return _FIX_FALLBACK
+
+    try:
+        connected, prompt = _prompt_header(vim_state, _CONTEXT_INTRO_EDITOR, "\n\n")
 
         prompt += "Please fix the code."
         if target is not None:
             prompt += f" The user has specifically asked: {target}"
-        elif vim_state.is_connected():
+        elif connected:
             prompt += " Use the context above to determine what should be fixed. If there is a current selection, that is the most important thing."
 
-        prompt += """
-
-Steps:
-1. Identify the issues that need fixing
-2. Apply appropriate fixes to resolve each issue
-3. Explain what you changed and why
-
-"""
+        prompt += _FIX_STEPS
 
-        if vim_state.is_connected():
-            prompt += "IMPORTANT: Do not call get_editor_context - the context provided above is current and up-to-date.\n\n"
+        if connected:
+            prompt += _USE_PROVIDED_CONTEXT
 
-        prompt += """Make sure each fix:
-- Addresses the root cause, not just the symptom
-- Follows best practices and coding standards
-- Doesn't introduce new issues
-- Is minimal and focused"""
+        prompt += _FIX_EACH_CRITERIA
 
         return prompt
 
     except Exception as e:
-        import traceback
-
-        error_details = "ERROR in fix prompt:\n"
-        error_details += f"Exception type: {type(e).__name__}\n"
-        error_details += f"Exception message: {str(e)}\n"
-        error_details += f"Traceback:\n{traceback.format_exc()}\n"
-        return error_details
+        return (
+            "ERROR in fix prompt:\n"
+            f"Exception type: {type(e).__name__}\n"
+            f"Exception message: {e}\n"
+            f"Traceback:\n{format_exc()}\n"
+        )
 
 
 def doc_prompt(vim_state: Any, target: Optional[str] = None) -> str:
@@ -271,50 +309,25 @@ def doc_prompt(vim_state: Any, target: Optional[str] = None) -> str:
     Adds appropriate documentation (docstrings, comments) to the code
     """
     try:
-        prompt = ""
-
-        if vim_state.is_connected():
-            context = vim_state.get_context()
-            prompt += "Current context:\n"
-            prompt += f"File: {context['filename']}\n"
-            prompt += f"Line: {context['line']}\n"
-
-            if context.get("visual_start", 0) > 0:
-                prompt += f"Selection: lines {context['visual_start']}-{context['visual_end']}\n"
+        connected, prompt = _prompt_header(vim_state, _CONTEXT_INTRO)
 
         prompt += "Please add documentation to the code."
         if target is not None:
             prompt += f" The user has specifically asked to document: {target}"
-        elif vim_state.is_connected():
+        elif connected:
             prompt += " Use the context above to determine what should be documented. If there is a current selection, that is the most important thing."
 
-        prompt += """
-
-Add:
-1. Docstrings for functions/classes (following language conventions)
-2. Inline comments for complex logic
-3. Type hints (if applicable)
-4. Usage examples (if helpful)
-
-Make the documentation:
-- Clear and concise
-- Focused on "why" not just "what"
-- Helpful for future maintainers
-
-Make sure to understand what the code does, and if other parts of the codebase
-will assist with that, read and understand them as well.
-"""
+        prompt += _ADD_DOC
 
         return prompt
 
     except Exception as e:
-        import traceback
-
-        error_details = "ERROR in doc prompt:\n"
-        error_details += f"Exception type: {type(e).__name__}\n"
-        error_details += f"Exception message: {str(e)}\n"
-        error_details += f"Traceback:\n{traceback.format_exc()}\n"
-        error_details += f"Function arguments: target={target}\n"
-        if vim_state.is_connected():
-            error_details += "Vim connected: True\n"
-        return error_details
+        connected = "Vim connected: True\n" if vim_state.connected else ""
+        return (
+            f"ERROR in doc prompt:\n"
+            f"Exception type: {type(e).__name__}\n"
+            f"Exception message: {e}\n"
+            f"Traceback:\n{format_exc()}\n"
+            f"Function arguments: target={target}\n"
+            f"{connected}"
+        )
@@ -4,19 +4,54 @@ Unix domain socket server for Vim communication.
 Manages socket lifecycle and bidirectional message handling with Vim.
 """
 
+import errno
+import functools
 import os
+import queue
+import selectors
 import socket
-import json
 import threading
 import logging
 import hashlib
 from pathlib import Path
 from typing import Any
 
+import json_codec
 from message_handler import handle_vim_message
+from vim_state import BATCH_SUFFIX, batch_prefix, encode_batch
 
 logger = logging.getLogger("vim-context")
 
+# Kernel send/receive buffer size for the Vim connection; large enough that a
+# typical annotation batch or whole-file context fits without blocking
+_SOCKET_BUFFER_SIZE = 1024 * 1024
+
+# Bytes read from the Vim socket per recv, sized to drain the kernel buffer
+_RECV_SIZE = _SOCKET_BUFFER_SIZE
+
+# Maximum number of queued requests coalesced into one socket write
+_SEND_BATCH_SIZE = 32
+
+# Requests that only carry an entries list; back-to-back ones are merged into
+# a single frame, so Vim parses and schedules a burst once. Maps each to the
+# prefix of its encoded frames.
+_MERGEABLE_BATCHES = {
+    request_type: batch_prefix(request_type)
+    for request_type in ("add_virtual_text_batch", "highlight_text_batch")
+}
+
+# Most queued batches merged into one frame, so a burst doesn't become one
+# frame so large that Vim's channel callback stalls on it
+_MERGE_LIMIT = 8
+
+# Encoded requests at least this large skip the batch buffer and are written
+# straight from their own bytes with sendmsg()
+_SCATTER_THRESHOLD = 16 * 1024
+
+# Merging stops before a batch that would take the frame past this many
+# bytes; a batch already this large is sent on its own
+_MERGE_BYTES = 4 * _SCATTER_THRESHOLD
+
 
 def _validate_vim_message(data: Any) -> bool:
     """
@@ -63,9 +98,16 @@ def _validate_vim_message(data: Any) -> bool:
 
 def get_socket_path() -> str:
     """Get socket path, using hashed directory structure for long paths."""
-    cwd_hash = hashlib.sha256(
-        os.environ.get("SOCKET_DIR", os.getcwd()).encode()
-    ).hexdigest()
+    return _socket_path_for(os.environ.get("SOCKET_DIR", os.getcwd()))
+
+
+@functools.lru_cache(maxsize=1)
+def _socket_path_for(base_dir: str) -> str:
+    """Hash base_dir into a socket path and create its directory (memoized).
+
+    Must stay SHA-256: the Vim plugin derives the same path with sha256().
+    """
+    cwd_hash = hashlib.sha256(base_dir.encode()).hexdigest()
     socket_dir = Path(f"/tmp/vim-q-connect/{cwd_hash}")
     socket_dir.mkdir(parents=True, exist_ok=True)
     return str(socket_dir / "sock")
@@ -76,97 +118,349 @@ def start_socket_server(vim_state: Any) -> None:
     socket_path = get_socket_path()
     logger.info(f"Creating MCP socket at: {socket_path}")
 
-    # Remove existing socket
-    try:
-        os.unlink(socket_path)
-    except FileNotFoundError:
-        pass
-
     vim_state.socket_server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-    vim_state.socket_server.bind(socket_path)
-    os.chmod(socket_path, 0o600)
+    _set_buffer_sizes(vim_state.socket_server)
+    _bind_fresh(vim_state.socket_server, Path(socket_path))
     vim_state.socket_server.listen(1)
 
-    def accept_connections() -> None:
-        while True:
-            try:
-                conn, addr = vim_state.socket_server.accept()
-                vim_state.vim_channel = conn
-                vim_state.set_connected(True)
-                logger.info("Vim connected to MCP socket")
-
-                # Listen for messages from Vim
-                threading.Thread(
-                    target=_listen_to_vim, args=(conn, vim_state), daemon=True
-                ).start()
-
-            except Exception as e:
-                logger.error(f"Error accepting connection: {e}")
-                break
+    vim_state.server_thread = threading.Thread(
+        target=_serve, args=(vim_state.socket_server, vim_state), daemon=True
+    )
+    vim_state.server_thread.start()
 
-    threading.Thread(target=accept_connections, daemon=True).start()
 
+def _bind_fresh(server: socket.socket, path: Path) -> None:
+    """Bind ``server`` to ``path``, replacing any stale socket file.
 
-def _listen_to_vim(conn: socket.socket, vim_state: Any) -> None:
-    """Listen for messages from Vim and handle outgoing requests."""
-    import queue
+    Another server starting in the same directory can recreate the file
+    between our unlink and bind; in that case remove it and retry once.
+    """
+    path.unlink(missing_ok=True)
+    try:
+        server.bind(str(path))
+    except OSError as e:
+        if e.errno != errno.EADDRINUSE:
+            raise
+        path.unlink(missing_ok=True)
+        server.bind(str(path))
+    path.chmod(0o600)
 
-    buffer = ""
+
+def close_listener(server: socket.socket) -> None:
+    """Close the listening socket and remove its socket file."""
+    try:
+        path = server.getsockname()
+    except OSError:
+        path = None  # Already closed
+    server.close()
+    if path:
+        Path(path).unlink(missing_ok=True)
+
+
+def _set_buffer_sizes(sock: socket.socket) -> None:
+    """Enlarge kernel buffers so big payloads take fewer recv/send calls."""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, _SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, _SOCKET_BUFFER_SIZE)
+
+
+def _accept_vim(server: socket.socket, vim_state: Any) -> socket.socket:
+    """Accept a Vim connection and mark it as the active channel."""
+    conn, _ = server.accept()
+    _set_buffer_sizes(conn)
+    # Never block the I/O thread on a slow reader; see _send_queued_requests
+    conn.setblocking(False)
+    vim_state.vim_channel = conn
+    vim_state.set_connected(True)
+    logger.info("Vim connected to MCP socket")
+    return conn
+
+
+def _process_line(line: bytearray, vim_state: Any) -> None:
+    """Decode, validate and dispatch one newline-delimited message from Vim."""
+    line = line.strip()
+    if not line:
+        # Skip empty lines
+        return
+
+    # Parse the raw bytes directly; both JSON backends reject malformed UTF-8.
+    # Working on whole lines means multi-byte characters split across recv()
+    # calls are fine.
+    try:
+        message = json_codec.loads(line)
+    except UnicodeDecodeError as e:
+        logger.error(f"Received malformed UTF-8 data, rejecting: {e}")
+        return
+    except json_codec.JSONDecodeError as e:
+        logger.warning(f"Failed to parse JSON line: {line!r}, error: {e}")
+        return
+
+    # Validate message structure before processing
+    if _validate_vim_message(message):
+        handle_vim_message(message, vim_state)
+    else:
+        logger.warning(f"Received invalid message structure: {message}")
+
+
+def _write_pending(conn: socket.socket, out: bytearray) -> bool:
+    """Write as much of ``out`` as the socket takes and drop the sent bytes.
+
+    Returns True once ``out`` is empty, False if the socket stopped accepting
+    data first.
+    """
+    try:
+        while out:
+            del out[: conn.send(out)]
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _merge_batches(request_type: str, messages: list) -> bytes:
+    """Encode one ``request_type`` frame holding the entries of ``messages``.
+
+    ``messages`` are dicts or bytes from encode_batch(); entry order is
+    preserved. Encoded entries are spliced together without being decoded.
+    """
+    prefix = _MERGEABLE_BATCHES[request_type]
+    start, end = len(prefix), -len(BATCH_SUFFIX)
+    bodies = []
+    for message in messages:
+        if type(message) is not bytes:
+            message = encode_batch(request_type, message["params"]["entries"])
+        body = message[start:end]
+        if body:  # An empty batch adds no entries, and no comma
+            bodies.append(body)
+    return prefix + b",".join(bodies) + BATCH_SUFFIX
+
+
+def _send_queued_requests(conn: socket.socket, requests: Any, out: bytearray) -> bool:
+    """Send queued requests to Vim as newline-delimited JSON until the queue
+    is empty or the non-blocking socket is full.
+
+    Queued messages are dicts, or bytes already encoded by the tool that
+    queued them. Consecutive annotation or highlight batches are merged into
+    one frame of at most _MERGE_LIMIT batches and, unless a single batch is
+    larger, _MERGE_BYTES bytes.
+
+    Up to _SEND_BATCH_SIZE requests are encoded into ``out``, a write buffer
+    kept across calls, and written together, so bursts cost one syscall per
+    batch rather than one per request. Requests encoding to
+    _SCATTER_THRESHOLD bytes or more are not copied into ``out`` unless the
+    socket fills up; they go out with sendmsg() straight from their bytes.
+
+    Returns True when everything was written. Returns False when the kernel
+    buffer is full: the unsent bytes stay in ``out``, later requests stay
+    queued, and the caller should call again once the socket is writable.
+    """
+    # Clear the wakeup first so a put() racing with the drain re-arms it
+    requests.clear_wakeup()
     while True:
-        try:
-            # Check for outgoing requests first
+        if out and not _write_pending(conn, out):
+            return False
+        for _ in range(_SEND_BATCH_SIZE):
             try:
-                request_type, request_data = vim_state.request_queue.get_nowait()
-                message = json.dumps(request_data) + "\n"
-                conn.send(message.encode("utf-8"))
-                logger.info(f"Sent {request_type} request to Vim")
+                request_type, request_data = requests.get_nowait()
             except queue.Empty:
-                pass
-
-            # Then check for incoming data
-            conn.settimeout(0.1)  # Non-blocking with short timeout
+                break
+            if request_type in _MERGEABLE_BATCHES and type(request_data) is bytes:
+                run = requests.get_run_nowait(
+                    request_type, _MERGE_LIMIT - 1, _MERGE_BYTES - len(request_data)
+                )
+                if run:
+                    request_data = _merge_batches(
+                        request_type, [request_data, *(data for _, data in run)]
+                    )
+            # Tools may hand over an already-encoded frame body
+            if type(request_data) is bytes:
+                payload = request_data
+            else:
+                payload = json_codec.dumps(request_data)
+            logger.debug("Sending %s request to Vim", request_type)
+            if len(payload) < _SCATTER_THRESHOLD:
+                out += payload
+                out += b"\n"
+                continue
+            # Keep frame order: flush the smaller frames batched before it
+            if out and not _write_pending(conn, out):
+                out += payload
+                out += b"\n"
+                return False
             try:
-                raw_data = conn.recv(65536)
-                if not raw_data:
-                    vim_state.set_connected(False)
-                    logger.info("Vim disconnected from MCP socket")
-                    break
+                sent = conn.sendmsg([payload, b"\n"])
+            except BlockingIOError:
+                sent = 0
+            if sent <= len(payload):
+                # Short write: keep the rest of the frame for the next call
+                out += memoryview(payload)[sent:]
+                out += b"\n"
+                return False
+        if not out:
+            if requests.qsize():
+                continue
+            return True
+
+
+def _serve(server: socket.socket, vim_state: Any) -> None:
+    """Accept Vim, read its messages and send queued requests on one thread.
+
+    Blocks in a single selector wait on the listening socket, the Vim
+    connection and the request queue's wakeup pipe, so there is one I/O thread
+    for the life of the server and it sleeps while idle. A new connection
+    replaces the current one; requests queued while Vim is away are sent once
+    it connects.
+
+    Returns once vim_state.close() has replaced ``server``, closing the
+    connection and the listening socket and removing the socket file.
+
+    The connection is non-blocking. If Vim stops reading, unsent bytes wait
+    in ``out`` and the connection is also watched for writability while reads
+    carry on; new requests back up in the bounded queue meanwhile.
+
+    An error on the connection drops just that connection and the loop keeps
+    accepting; it only ends early if the listener or the selector fails.
+    """
+    requests = vim_state.request_queue
+    selector = selectors.DefaultSelector()
+
+    # recv_into a preallocated buffer: no new bytes object per recv
+    recv_view = memoryview(bytearray(_RECV_SIZE))
+    buffer = bytearray()
+    out = bytearray()
+    # Bind hot-loop callables to locals (LOAD_FAST instead of attribute and
+    # global lookups on every message). The buffer is only mutated in place,
+    # so its bound find stays valid.
+    select = selector.select
+    find = buffer.find
+    process_line = _process_line
+    conn = None
+    # True while the kernel send buffer is full and output waits in ``out``
+    write_blocked = False
+
+    def drop_connection() -> None:
+        nonlocal conn, write_blocked
+        selector.unregister(conn)
+        conn.close()
+        conn = None
+        write_blocked = False
+        del buffer[:]
+        del out[:]  # A partial frame must not reach the next connection
+        vim_state.set_connected(False)
+
+    def flush() -> None:
+        """Send queued requests, waiting for writability if the socket fills."""
+        nonlocal write_blocked
+        try:
+            done = _send_queued_requests(conn, requests, out)
+        except Exception as e:
+            # Only this connection is lost; keep serving
+            logger.error("Error in Vim communication: %s", e)
+            drop_connection()
+            return
+        if done == write_blocked:
+            write_blocked = not done
+            events = selectors.EVENT_READ
+            if write_blocked:
+                events |= selectors.EVENT_WRITE
+            selector.modify(conn, events, "recv")
+
+    def receive() -> None:
+        """Read from Vim and handle every complete message received."""
+        try:
+            received = conn.recv_into(recv_view)
+            if not received:
+                logger.info("Vim disconnected from MCP socket")
+        except BlockingIOError:
+            return  # Spurious readiness; nothing to read yet
+        except OSError as e:
+            logger.error("Error in Vim communication: %s", e)
+            received = 0
+        if not received:
+            drop_connection()
+            return
+
+        raw_data = recv_view[:received]
+        # The partial line kept from earlier recvs has no newline in it, so
+        # only the newly received bytes need scanning
+        scan_from = len(buffer)
+        buffer.extend(raw_data)
+        logger.debug("Received %d bytes from Vim", len(raw_data))
+
+        # Handle complete newline-delimited JSON messages
+        # Protocol: each message ends with \n (Vim's channel is in nl mode).
+        # Every byte is scanned once, and only the trailing partial line is
+        # kept for the next recv.
+        start = 0
+        while (end := find(b"\n", scan_from)) != -1:
+            line = buffer[start:end]
+            start = scan_from = end + 1
+            process_line(line, vim_state)
+        del buffer[:start]
+
+    def accept() -> bool:
+        """Accept a new Vim connection; False once the listener is unusable."""
+        nonlocal conn
+        if conn is not None:
+            drop_connection()  # Superseded by the new connection
+        try:
+            conn = _accept_vim(server, vim_state)
+        except OSError as e:
+            logger.error("Error accepting connection: %s", e)
+            # A connection aborted before accept() is that client's problem;
+            # anything else means the listener itself has failed
+            return e.errno == errno.ECONNABORTED
+        selector.register(conn, selectors.EVENT_READ, "recv")
+        # Flush anything queued while Vim was away
+        if requests.qsize():
+            flush()
+        return True
 
-                # Strict UTF-8 decoding - reject malformed sequences
-                try:
-                    data = raw_data.decode("utf-8")
-                except UnicodeDecodeError as e:
-                    logger.error(f"Received malformed UTF-8 data, rejecting: {e}")
+    try:
+        selector.register(server, selectors.EVENT_READ, "accept")
+        selector.register(requests.wakeup_fd, selectors.EVENT_READ, "send")
+        # close() replaces socket_server before waking the selector. Checked
+        # on every pass: a flush can drain close()'s wakeup byte along with
+        # the requests' ones.
+        while vim_state.socket_server is server:
+            events = select()
+            if vim_state.socket_server is not server:
+                break  # Stopped by close(); cleanup below
+            for key, mask in events:
+                if key.data == "accept":
+                    if not accept():
+                        return
                     continue
 
-                buffer += data
-                logger.info(f"Received data from Vim: {data}")
-
-                # Handle complete newline-delimited JSON messages
-                # Protocol: each message ends with \n
-                while "\n" in buffer:
-                    line, buffer = buffer.split("\n", 1)
-                    if not line.strip():
-                        # Skip empty lines
+                if key.data == "send":
+                    if conn is None or write_blocked:
+                        # Keep the requests queued until there is somewhere to
+                        # write them; the writable event drains the queue
+                        requests.clear_wakeup()
                         continue
+                    flush()
+                    continue
 
-                    try:
-                        message = json.loads(line.strip())
-                        # Validate message structure before processing
-                        if _validate_vim_message(message):
-                            handle_vim_message(line.strip(), vim_state)
-                        else:
-                            logger.warning(
-                                f"Received invalid message structure: {message}"
-                            )
-                    except json.JSONDecodeError as e:
-                        logger.warning(
-                            f"Failed to parse JSON line: {line.strip()}, error: {e}"
-                        )
-            except socket.timeout:
-                pass  # Continue loop to check request queue
+                if key.fileobj is not conn:
+                    continue  # Replaced earlier in this batch of events
 
-        except Exception as e:
-            logger.error(f"Error in Vim communication: {e}")
-            vim_state.set_connected(False)
-            break
+                try:
+                    if mask & selectors.EVENT_WRITE:
+                        flush()
+                        if conn is None or not mask & selectors.EVENT_READ:
+                            continue
+                    receive()
+                except Exception as e:
+                    # Only this connection is lost; keep serving
+                    logger.error("Error in Vim communication: %s", e)
+                    if conn is not None:
+                        drop_connection()
+
+    except Exception as e:
+        # The listener or the selector itself failed
+        logger.error("Error in Vim socket server: %s", e)
+        vim_state.set_connected(False)
+    finally:
+        if conn is not None:
+            drop_connection()
+        selector.close()
+        if vim_state.socket_server is not server:
+            close_listener(server)
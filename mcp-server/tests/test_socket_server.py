@@ -0,0 +1,153 @@
+"""
+Tests for merging queued annotation and highlight batches in socket_server,
+and for stopping the server.
+"""
+
+import json
+import os
+import socket
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import json_codec
+from socket_server import (
+    _MERGE_BYTES,
+    _MERGE_LIMIT,
+    _merge_batches,
+    _send_queued_requests,
+    get_socket_path,
+)
+from vim_state import RequestQueue, VimState, encode_batch
+
+BATCH = "add_virtual_text_batch"
+
+
+def _entries(frame: bytes) -> list:
+    message = json.loads(frame)
+    assert message["method"] == BATCH
+    return message["params"]["entries"]
+
+
+class EncodeBatchTest(unittest.TestCase):
+    def test_matches_plain_encoding(self):
+        entries = [{"line": "x = 1", "text": "🔒 naïve \"quote\"\nsecond"}]
+        self.assertEqual(
+            encode_batch(BATCH, entries),
+            json_codec.dumps({"method": BATCH, "params": {"entries": entries}}),
+        )
+
+    def test_empty_batch_is_valid_json(self):
+        self.assertEqual(_entries(encode_batch(BATCH, [])), [])
+
+
+class MergeBatchesTest(unittest.TestCase):
+    def test_keeps_entry_order(self):
+        frames = [encode_batch(BATCH, [{"n": 1}, {"n": 2}]), encode_batch(BATCH, [{"n": 3}])]
+        merged = _merge_batches(BATCH, frames)
+        self.assertEqual(_entries(merged), [{"n": 1}, {"n": 2}, {"n": 3}])
+
+    def test_accepts_dict_messages(self):
+        message = {"method": BATCH, "params": {"entries": [{"n": 2}]}}
+        merged = _merge_batches(BATCH, [encode_batch(BATCH, [{"n": 1}]), message])
+        self.assertEqual(_entries(merged), [{"n": 1}, {"n": 2}])
+
+    def test_skips_empty_batches(self):
+        frames = [
+            encode_batch(BATCH, []),
+            encode_batch(BATCH, [{"n": 1}]),
+            encode_batch(BATCH, []),
+        ]
+        self.assertEqual(_entries(_merge_batches(BATCH, frames)), [{"n": 1}])
+
+
+class _FakeConn:
+    """Socket stand-in that accepts every byte."""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def send(self, data) -> int:
+        self.data += data
+        return len(data)
+
+    def sendmsg(self, buffers) -> int:
+        for buf in buffers:
+            self.data += buf
+        return sum(len(buf) for buf in buffers)
+
+
+class SendQueuedRequestsTest(unittest.TestCase):
+    def setUp(self):
+        self.requests = RequestQueue()
+        self.addCleanup(self.requests.close)
+
+    def _send(self, requests: RequestQueue) -> list:
+        conn = _FakeConn()
+        self.assertTrue(_send_queued_requests(conn, requests, bytearray()))
+        return [json.loads(line) for line in bytes(conn.data).splitlines()]
+
+    def test_merged_frames_are_capped(self):
+        requests = self.requests
+        for i in range(2 * _MERGE_LIMIT + 1):
+            requests.put((BATCH, encode_batch(BATCH, [{"n": i}])))
+        frames = self._send(requests)
+        sizes = [len(frame["params"]["entries"]) for frame in frames]
+        self.assertEqual(sizes, [_MERGE_LIMIT, _MERGE_LIMIT, 1])
+        entries = [entry for frame in frames for entry in frame["params"]["entries"]]
+        self.assertEqual(entries, [{"n": i} for i in range(2 * _MERGE_LIMIT + 1)])
+
+    def test_large_batches_are_capped_by_size(self):
+        requests = self.requests
+        text = "x" * (_MERGE_BYTES // 3)
+        for i in range(_MERGE_LIMIT):
+            requests.put((BATCH, encode_batch(BATCH, [{"n": i, "text": text}])))
+        frames = self._send(requests)
+        # Two batches fit under the byte budget; a third would go past it
+        sizes = [len(frame["params"]["entries"]) for frame in frames]
+        self.assertEqual(sizes, [2, 2, 2, 2])
+        entries = [entry for frame in frames for entry in frame["params"]["entries"]]
+        self.assertEqual([entry["n"] for entry in entries], list(range(_MERGE_LIMIT)))
+
+    def test_oversized_batch_is_sent_alone(self):
+        requests = self.requests
+        requests.put((BATCH, encode_batch(BATCH, [{"text": "x" * _MERGE_BYTES}])))
+        requests.put((BATCH, encode_batch(BATCH, [{"n": 1}])))
+        sizes = [len(frame["params"]["entries"]) for frame in self._send(requests)]
+        self.assertEqual(sizes, [1, 1])
+
+    def test_other_requests_break_the_run(self):
+        requests = self.requests
+        requests.put((BATCH, encode_batch(BATCH, [{"n": 1}])))
+        requests.put(("goto_line", {"method": "goto_line", "params": {"line": 3}}))
+        requests.put((BATCH, encode_batch(BATCH, [{"n": 2}])))
+        methods = [frame["method"] for frame in self._send(requests)]
+        self.assertEqual(methods, [BATCH, "goto_line", BATCH])
+
+
+class ShutdownTest(unittest.TestCase):
+    def test_close_stops_thread_and_removes_socket(self):
+        with tempfile.TemporaryDirectory() as socket_dir, mock.patch.dict(
+            os.environ, {"SOCKET_DIR": socket_dir}
+        ):
+            path = get_socket_path()
+            self.addCleanup(os.rmdir, os.path.dirname(path))
+            state = VimState()
+            self.addCleanup(state.close)
+            state.ensure_started()
+            thread = state.server_thread
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as vim:
+                vim.connect(path)
+                deadline = time.monotonic() + 1
+                while not state.connected and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                self.assertTrue(state.connected)
+                state.close()
+                self.assertFalse(thread.is_alive())
+                self.assertFalse(os.path.exists(path))
+                self.assertEqual(vim.recv(1), b"")  # Connection closed
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Tests for tool-level behaviour: annotations cache invalidation and reporting
+a full request queue.
+"""
+
+import unittest
+
+import tool_registry
+from annotations_tools import add_virtual_text, clear_annotations
+from tools import add_to_quickfix, clear_quickfix, goto_line
+from vim_state import BACKLOG_FULL, VimState
+
+KEY = ("a.py", 10, 100)
+
+
+class AnnotationsCacheInvalidationTest(unittest.TestCase):
+    def setUp(self):
+        self.state = VimState()
+        self.addCleanup(self.state.close)
+        self.state.set_connected(True)
+        _, generation = self.state.cached_annotations(KEY)
+        self.state.store_annotations(KEY, generation, "[]")
+
+    def assert_invalidated(self):
+        self.assertIsNone(self.state.cached_annotations(KEY)[0])
+
+    def test_add_virtual_text(self):
+        add_virtual_text(self.state, [{"line": "x", "text": "note"}])
+        self.assert_invalidated()
+
+    def test_clear_annotations(self):
+        clear_annotations(self.state)
+        self.assert_invalidated()
+
+    def test_add_to_quickfix(self):
+        add_to_quickfix(self.state, [{"line_number": 1, "text": "issue"}])
+        self.assert_invalidated()
+
+    def test_clear_quickfix(self):
+        clear_quickfix(self.state)
+        self.assert_invalidated()
+
+    def test_goto_line(self):
+        # The cursor moves, so the next get_annotations must ask Vim again
+        goto_line(self.state, 3)
+        self.assert_invalidated()
+
+
+class BacklogFullTest(unittest.TestCase):
+    def test_full_queue_is_reported(self):
+        state = VimState()
+        self.addCleanup(state.close)
+        state.set_connected(True)
+        state.request_queue.maxsize = 1
+        tool = tool_registry._bind_vim_state(goto_line, state)
+        self.assertEqual(tool(1), "Navigation command sent: line 1")
+        self.assertEqual(tool(2), BACKLOG_FULL)
+        add = tool_registry._bind_vim_state(add_virtual_text, state)
+        self.assertEqual(add([{"line": "x", "text": "note"}]), BACKLOG_FULL)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,274 @@
+"""
+Tests for the request queue, response slots, clear dedupe and annotations
+cache in vim_state.
+"""
+
+import os
+import queue
+import threading
+import unittest
+from unittest import mock
+
+import vim_state
+from vim_state import DISCONNECTED, RESPONSE_SLOTS, RequestQueue, VimState
+
+
+def _new_state(test: unittest.TestCase, connected: bool = False) -> VimState:
+    state = VimState()
+    test.addCleanup(state.close)
+    if connected:
+        state.set_connected(True)
+    return state
+
+
+class RequestQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.requests = RequestQueue(maxsize=3)
+        self.addCleanup(self.requests.close)
+
+    def _pending_wakeup_bytes(self) -> bytes:
+        try:
+            return os.read(self.requests.wakeup_fd, 4096)
+        except BlockingIOError:
+            return b""
+
+    def test_put_get_is_fifo(self):
+        for i in range(3):
+            self.requests.put(("goto_line", i))
+        self.assertEqual(self.requests.qsize(), 3)
+        self.assertEqual(self.requests.get_nowait(), ("goto_line", 0))
+        self.assertEqual(self.requests.get(timeout=0), ("goto_line", 1))
+        self.assertEqual(self.requests.get_nowait(), ("goto_line", 2))
+        self.assertRaises(queue.Empty, self.requests.get_nowait)
+        self.assertRaises(queue.Empty, self.requests.get, timeout=0.01)
+
+    def test_put_returns_increasing_sequence(self):
+        self.assertEqual(self.requests.put(("a", 1)), 1)
+        self.assertEqual(self.requests.put(("b", 2)), 2)
+        self.requests.get_nowait()
+        self.assertEqual(self.requests.put(("c", 3)), 3)
+        self.assertEqual(self.requests.sequence, 3)
+
+    def test_put_raises_full_at_maxsize(self):
+        for i in range(3):
+            self.requests.put(("goto_line", i))
+        with self.assertRaises(queue.Full):
+            self.requests.put(("goto_line", 3))
+        # A rejected put isn't queued or counted
+        self.assertEqual(self.requests.qsize(), 3)
+        self.assertEqual(self.requests.sequence, 3)
+
+    def test_one_wakeup_byte_per_drain(self):
+        self.requests.put(("a", 1))
+        self.requests.put(("b", 2))
+        self.assertEqual(self._pending_wakeup_bytes(), b"\x01")
+
+    def test_get_run_nowait_takes_only_the_leading_run(self):
+        for item in (("batch", b"1"), ("batch", b"2"), ("other", b"3")):
+            self.requests.put(item)
+        self.assertEqual(self.requests.get_run_nowait("other", 8, 100), [])
+        self.assertEqual(
+            self.requests.get_run_nowait("batch", 8, 100),
+            [("batch", b"1"), ("batch", b"2")],
+        )
+        self.assertEqual(self.requests.get_nowait(), ("other", b"3"))
+
+    def test_get_run_nowait_respects_limit_and_max_bytes(self):
+        for data in (b"12", b"345", b"6"):
+            self.requests.put(("batch", data))
+        run = self.requests.get_run_nowait("batch", 1, 100)
+        self.assertEqual(run, [("batch", b"12")])
+        # b"345" would take the run past 2 bytes, so it stays queued
+        self.assertEqual(self.requests.get_run_nowait("batch", 8, 2), [])
+        self.assertEqual(self.requests.qsize(), 2)
+
+    def test_get_run_nowait_stops_at_unencoded_data(self):
+        self.requests.put(("batch", b"1"))
+        self.requests.put(("batch", {"entries": []}))
+        run = self.requests.get_run_nowait("batch", 8, 100)
+        self.assertEqual(run, [("batch", b"1")])
+        self.assertEqual(self.requests.qsize(), 1)
+
+    def test_clear_wakeup_drains_pipe_and_rearms(self):
+        self.requests.put(("a", 1))
+        self.requests.clear_wakeup()
+        self.assertEqual(self._pending_wakeup_bytes(), b"")
+        self.requests.put(("b", 2))
+        self.assertEqual(self._pending_wakeup_bytes(), b"\x01")
+
+    def test_wake_writes_without_queueing(self):
+        self.requests.wake()
+        self.assertEqual(self._pending_wakeup_bytes(), b"\x01")
+        self.assertEqual(self.requests.qsize(), 0)
+
+    def test_close_closes_pipe_and_keeps_items(self):
+        wakeup_fd = self.requests.wakeup_fd
+        self.requests.close()
+        self.assertEqual(self.requests.wakeup_fd, -1)
+        self.assertRaises(OSError, os.fstat, wakeup_fd)
+        # Puts and wakes after close queue without touching the pipe
+        self.requests.put(("a", 1))
+        self.requests.wake()
+        self.requests.clear_wakeup()
+        self.assertEqual(self.requests.qsize(), 1)
+        self.requests.close()
+
+    def test_reopen_wakes_for_queued_items(self):
+        self.requests.close()
+        self.requests.put(("a", 1))
+        self.requests.reopen()
+        self.assertEqual(self._pending_wakeup_bytes(), b"\x01")
+        self.assertEqual(self.requests.get_nowait(), ("a", 1))
+
+
+class ResponseSlotsTest(unittest.TestCase):
+    def test_resolve_delivers_result(self):
+        state = _new_state(self)
+        request_id, pending = state.register_response()
+        self.assertTrue(state.resolve_response(request_id, ("annotations", [])))
+        self.assertTrue(pending.event.is_set())
+        self.assertEqual(pending.result, ("annotations", []))
+        state.release_response(request_id)
+
+    def test_late_reply_after_release_is_dropped(self):
+        state = _new_state(self)
+        request_id, pending = state.register_response()
+        state.release_response(request_id)
+        self.assertFalse(state.resolve_response(request_id, ("annotations", [])))
+        self.assertIsNone(pending.result)
+
+    def test_unknown_ids_are_ignored(self):
+        state = _new_state(self)
+        for request_id in (None, "not-a-number", "12345"):
+            self.assertFalse(state.resolve_response(request_id, ("x", None)))
+
+    def test_exhausted_slots_raise_runtime_error(self):
+        state = _new_state(self)
+        ids = [state.register_response()[0] for _ in range(RESPONSE_SLOTS)]
+        self.assertEqual(len(set(ids)), RESPONSE_SLOTS)
+        with self.assertRaises(RuntimeError):
+            state.register_response()
+        # Releasing one slot makes room again
+        state.release_response(ids[0])
+        state.register_response()
+
+    def test_disconnect_wakes_waiters(self):
+        state = _new_state(self, connected=True)
+        request_id, pending = state.register_response()
+        waiter = threading.Thread(target=pending.event.wait, args=(5,))
+        waiter.start()
+        state.set_connected(False)
+        waiter.join(1)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(pending.result, DISCONNECTED)
+        state.release_response(request_id)
+
+    def test_disconnect_keeps_delivered_results(self):
+        state = _new_state(self, connected=True)
+        request_id, pending = state.register_response()
+        state.resolve_response(request_id, ("quickfix_entry", {"text": "x"}))
+        state.set_connected(False)
+        self.assertEqual(pending.result, ("quickfix_entry", {"text": "x"}))
+
+
+class ClearDedupeTest(unittest.TestCase):
+    REQUEST = ("clear_highlights", {"method": "clear_highlights", "params": {}})
+
+    def test_not_connected_sends_nothing(self):
+        state = _new_state(self)
+        self.assertFalse(state.enqueue_clear(self.REQUEST, None))
+        self.assertEqual(state.request_queue.qsize(), 0)
+
+    def test_repeated_clear_is_sent_once(self):
+        state = _new_state(self, connected=True)
+        self.assertTrue(state.enqueue_clear(self.REQUEST, None))
+        self.assertTrue(state.enqueue_clear(self.REQUEST, None))
+        self.assertEqual(state.request_queue.qsize(), 1)
+
+    def test_repeat_while_disconnected_reports_failure(self):
+        state = _new_state(self, connected=True)
+        state.enqueue_clear(self.REQUEST, None)
+        state.set_connected(False)
+        self.assertFalse(state.enqueue_clear(self.REQUEST, None))
+
+    def test_other_request_in_between_invalidates(self):
+        state = _new_state(self, connected=True)
+        state.enqueue_clear(self.REQUEST, None)
+        state.enqueue("goto_line", {"line": 1, "filename": "other.py"})
+        state.enqueue_clear(self.REQUEST, None)
+        self.assertEqual(state.request_queue.qsize(), 3)
+
+    def test_different_filename_or_op_is_sent(self):
+        state = _new_state(self, connected=True)
+        state.enqueue_clear(self.REQUEST, None)
+        state.enqueue_clear(self.REQUEST, "a.py")
+        state.enqueue_clear(("clear_annotations", {}), "a.py")
+        self.assertEqual(state.request_queue.qsize(), 3)
+
+    def test_repeat_after_window_is_sent(self):
+        state = _new_state(self, connected=True)
+        with mock.patch.object(vim_state.time, "monotonic", return_value=100.0):
+            state.enqueue_clear(self.REQUEST, None)
+        later = 100.0 + 2 * vim_state.CLEAR_DEDUP_WINDOW
+        with mock.patch.object(vim_state.time, "monotonic", return_value=later):
+            state.enqueue_clear(self.REQUEST, None)
+        self.assertEqual(state.request_queue.qsize(), 2)
+
+
+class AnnotationsCacheTest(unittest.TestCase):
+    KEY = ("a.py", 10, 100)
+
+    def _store(self, state: VimState, now: float) -> None:
+        with mock.patch.object(vim_state.time, "monotonic", return_value=now):
+            _, generation = state.cached_annotations(self.KEY)
+            state.store_annotations(self.KEY, generation, "[]")
+
+    def _cached(self, state: VimState, now: float, key=KEY):
+        with mock.patch.object(vim_state.time, "monotonic", return_value=now):
+            return state.cached_annotations(key)[0]
+
+    def test_hit_within_ttl(self):
+        state = _new_state(self)
+        self._store(state, 100.0)
+        self.assertEqual(self._cached(state, 100.1), "[]")
+
+    def test_expires_after_ttl(self):
+        state = _new_state(self)
+        self._store(state, 100.0)
+        self.assertIsNone(self._cached(state, 100.0 + 2 * vim_state.ANNOTATIONS_CACHE_TTL))
+
+    def test_other_position_misses(self):
+        state = _new_state(self)
+        self._store(state, 100.0)
+        self.assertIsNone(self._cached(state, 100.0, ("a.py", 11, 100)))
+
+    def test_invalidate_drops_entry(self):
+        state = _new_state(self)
+        self._store(state, 100.0)
+        state.invalidate_annotations()
+        self.assertIsNone(self._cached(state, 100.0))
+
+    def test_disconnect_drops_entry(self):
+        state = _new_state(self, connected=True)
+        self._store(state, 100.0)
+        state.set_connected(False)
+        self.assertIsNone(self._cached(state, 100.0))
+
+    def test_result_older_than_invalidation_is_not_stored(self):
+        state = _new_state(self)
+        _, generation = state.cached_annotations(self.KEY)
+        state.invalidate_annotations()  # A change queued while waiting
+        state.store_annotations(self.KEY, generation, "[]")
+        self.assertIsNone(state.cached_annotations(self.KEY)[0])
+
+
+class VimStateCloseTest(unittest.TestCase):
+    def test_close_without_server_closes_queue_pipe(self):
+        state = VimState()
+        wakeup_fd = state.request_queue.wakeup_fd
+        state.close()
+        self.assertRaises(OSError, os.fstat, wakeup_fd)
+
+
+if __name__ == "__main__":
+    unittest.main()
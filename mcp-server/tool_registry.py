@@ -0,0 +1,71 @@
+"""
+MCP tool registration for the vim-q-connect server.
+
+Holds the one authoritative list of tools and binds each implementation to a
+VimState, so every entry point registers the same tools in a single pass.
+"""
+
+import functools
+import inspect
+import queue
+from typing import Any, Callable
+
+from vim_state import BACKLOG_FULL
+
+from tools import (
+    get_editor_context,
+    goto_line,
+    add_to_quickfix,
+    get_current_quickfix_entry,
+    clear_quickfix,
+)
+from annotations_tools import (
+    add_virtual_text,
+    get_annotations_above_current_position,
+    clear_annotations,
+)
+from highlights_tools import (
+    highlight_text,
+    clear_highlights,
+)
+
+# Each implementation's docstring and signature (minus vim_state) become the
+# tool's description and schema; the tool is named <function>_tool.
+TOOLS = (
+    get_editor_context,
+    goto_line,
+    add_virtual_text,
+    add_to_quickfix,
+    get_current_quickfix_entry,
+    clear_quickfix,
+    get_annotations_above_current_position,
+    clear_annotations,
+    highlight_text,
+    clear_highlights,
+)
+
+
+def _bind_vim_state(fn: Callable, vim_state: Any) -> Callable:
+    """Wrap a tool implementation with vim_state bound as its first argument."""
+
+    @functools.wraps(fn)
+    def tool(*args, **kwargs):
+        try:
+            return fn(vim_state, *args, **kwargs)
+        except queue.Full:
+            # Vim has stopped reading and the request queue is full
+            return BACKLOG_FULL
+
+    # FastMCP builds the schema from the signature, so hide vim_state from it
+    signature = inspect.signature(fn)
+    tool.__signature__ = signature.replace(
+        parameters=tuple(signature.parameters.values())[1:]
+    )
+    tool.__name__ = f"{fn.__name__}_tool"
+    return tool
+
+
+def register(mcp: Any, vim_state: Any) -> None:
+    """Register every tool in TOOLS on ``mcp``, bound to ``vim_state``."""
+    for fn in TOOLS:
+        mcp.tool(_bind_vim_state(fn, vim_state))
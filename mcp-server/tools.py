@@ -2,13 +2,27 @@
 MCP tools for editor context and navigation.
 """
 
+import functools
 import logging
-import queue
-import uuid
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
+
+import json_codec
+from config import RESPONSE_TIMEOUT
 
 logger = logging.getLogger("vim-context")
 
+# Constant request, built once and shared by every call
+_CLEAR_QUICKFIX = ("clear_quickfix", {"method": "clear_quickfix", "params": {}})
+
+
+@functools.lru_cache(maxsize=64)
+def _goto_line_request(line_number: int, filename: Optional[str]) -> Tuple[str, bytes]:
+    """Encoded goto_line request; scripted sessions repeat the same jumps."""
+    params: Dict[str, Any] = {"line": line_number}
+    if filename is not None:
+        params["filename"] = filename
+    return ("goto_line", json_codec.dumps({"method": "goto_line", "params": params}))
+
 
 def get_editor_context(vim_state: Any) -> Dict[str, Any]:
     """Get the current editor context from Vim via channel. Use this tool
@@ -20,7 +34,7 @@ def get_editor_context(vim_state: Any) -> Dict[str, Any]:
     current editor content.
     """
 
-    if not vim_state.is_connected():
+    if not vim_state.connected:
         return {
             "content": "Editor not connected - no context available",
             "filename": "",
@@ -62,7 +76,6 @@ def goto_line(vim_state: Any, line_number: int, filename: Optional[str] = None)
     """Navigate to a specific line in Vim.
 
     Args:
-        vim_state: Vim state object for communicating with the editor
         line_number: Line number to navigate to
         filename: Optional filename to navigate to (if not provided, navigates in current buffer)
 
@@ -70,30 +83,14 @@ def goto_line(vim_state: Any, line_number: int, filename: Optional[str] = None)
         Confirmation message with navigation details, or error message if Vim is not connected
     """
 
-    if not vim_state.is_connected():
+    if not vim_state.enqueue_request(_goto_line_request(line_number, filename)):
         return "Vim not connected to MCP socket"
+    # Vim answers get_annotations from the cursor line, which this moves
+    vim_state.invalidate_annotations()
 
-    try:
-        params: Dict[str, Any] = {"line": line_number}
-        if filename is not None:
-            params["filename"] = filename
-
-        vim_state.request_queue.put(
-            (
-                "goto_line",
-                {
-                    "method": "goto_line",
-                    "params": params,
-                },
-            )
-        )
-
-        return f"Navigation command sent: line {line_number}" + (
-            f" in {filename}" if filename else ""
-        )
-    except Exception as e:
-        logger.error(f"Error sending navigation command: {e}")
-        return f"Error sending navigation command: {e}"
+    return f"Navigation command sent: line {line_number}" + (
+        f" in {filename}" if filename else ""
+    )
 
 
 def add_to_quickfix(vim_state: Any, entries: list[Dict[str, Any]]) -> str:
@@ -117,21 +114,12 @@ def add_to_quickfix(vim_state: Any, entries: list[Dict[str, Any]]) -> str:
             - line_number_hint (int, optional): Hint for tie-breaking when multiple matches exist
     """
 
-    if not vim_state.is_connected():
+    if not vim_state.enqueue("add_to_quickfix", {"entries": entries}):
         return "Vim not connected to MCP socket"
+    # Vim may auto-annotate the new entries
+    vim_state.invalidate_annotations()
 
-    try:
-        vim_state.request_queue.put(
-            (
-                "add_to_quickfix",
-                {"method": "add_to_quickfix", "params": {"entries": entries}},
-            )
-        )
-
-        return f"Added {len(entries)} entries to quickfix list"
-    except Exception as e:
-        logger.error(f"Error sending quickfix command: {e}")
-        return f"Error sending quickfix command: {e}"
+    return f"Added {len(entries)} entries to quickfix list"
 
 
 def get_current_quickfix_entry(vim_state: Any) -> Dict[str, Any]:
@@ -149,39 +137,40 @@ def get_current_quickfix_entry(vim_state: Any) -> Dict[str, Any]:
         - error: Error message if quickfix is empty or Vim not connected
     """
 
-    if not vim_state.is_connected():
+    if not vim_state.connected:
         return {"error": "Vim not connected to MCP socket"}
 
     try:
-        # Create unique request ID and response queue
-        request_id = str(uuid.uuid4())
-        response_queue: queue.Queue = queue.Queue()
-        vim_state.response_queues[request_id] = response_queue
-
-        # Put request in queue for server thread to send
-        vim_state.request_queue.put(
-            (
-                "get_current_quickfix",
-                {
-                    "method": "get_current_quickfix",
-                    "request_id": request_id,
-                    "params": {},
-                },
-            )
-        )
+        # Create unique request ID and response slot
+        request_id, pending = vim_state.register_response()
 
-        # Wait for response
+        # Release the slot even if the request can't be queued
         try:
-            response_type, data = response_queue.get(timeout=5.0)
+            # Put request in queue for server thread to send
+            vim_state.request_queue.put(
+                (
+                    "get_current_quickfix",
+                    {
+                        "method": "get_current_quickfix",
+                        "request_id": request_id,
+                        "params": {},
+                    },
+                )
+            )
+
+            # Wait for response
+            if not pending.event.wait(timeout=RESPONSE_TIMEOUT):
+                return {"error": "Timeout waiting for quickfix entry response"}
+            response_type, data = pending.result
             if response_type == "quickfix_entry":
                 return data
+            elif response_type == "disconnected":
+                return {"error": "Vim disconnected before sending quickfix entry"}
             else:
                 return {"error": f"Unexpected response type: {response_type}"}
-        except queue.Empty:
-            return {"error": "Timeout waiting for quickfix entry response"}
         finally:
-            # Clean up response queue
-            del vim_state.response_queues[request_id]
+            # Clean up response slot
+            vim_state.release_response(request_id)
 
     except Exception as e:
         logger.error(f"Error requesting quickfix entry: {e}")
@@ -198,15 +187,9 @@ def clear_quickfix(vim_state: Any) -> str:
         Status message indicating success or failure
     """
 
-    if not vim_state.is_connected():
+    if not vim_state.enqueue_request(_CLEAR_QUICKFIX):
         return "Vim not connected to MCP socket"
+    # Vim removes the quickfix annotations along with the list
+    vim_state.invalidate_annotations()
 
-    try:
-        vim_state.request_queue.put(
-            ("clear_quickfix", {"method": "clear_quickfix", "params": {}})
-        )
-
-        return "Cleared quickfix list"
-    except Exception as e:
-        logger.error(f"Error sending clear quickfix command: {e}")
-        return f"Error sending clear quickfix command: {e}"
+    return "Cleared quickfix list"
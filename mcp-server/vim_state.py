@@ -2,66 +2,533 @@
 Thread-safe state management for Vim editor connection and context.
 
 Manages shared state between MCP server thread and socket listener threads.
-Uses a single lock (_lock) to protect current_context and vim_connected flag.
+The editor context is published as an immutable snapshot: writers rebind
+current_context to a new dict and readers take the reference, both atomic
+under the GIL. The connected flag is a plain bool for the same reason.
 """
 
+import itertools
+import os
 import threading
 import queue
-from typing import Optional, Dict, Any
+import time
+from collections import deque
+from typing import Optional, Dict, Any, Tuple, Union
+
+import json_codec
+
+# Identical clear requests closer together than this are sent only once
+CLEAR_DEDUP_WINDOW = 0.05
+
+# Seconds a get_annotations result is reused for the same cursor position
+ANNOTATIONS_CACHE_TTL = 0.25
+
+# Editor context fields and their defaults when Vim omits them
+DEFAULT_CONTEXT: Dict[str, Any] = {
+    "context": "No context available",  # File content or selected text
+    "filename": "",  # Absolute path to current file
+    "line": 0,  # Current cursor line (1-indexed)
+    "visual_start": 0,  # Selection start line (0 = no selection)
+    "visual_end": 0,  # Selection end line (0 = no selection)
+    "visual_start_col": 0,  # Selection start column (1-indexed, 0 = no selection)
+    "visual_end_col": 0,  # Selection end column (1-indexed, 0 = no selection)
+    "visual_start_line_len": 0,  # Length of start line (0 = no selection)
+    "visual_end_line_len": 0,  # Length of end line (0 = no selection)
+    "total_lines": 0,  # Total lines in file
+    "modified": False,  # True if file has unsaved changes
+    "encoding": "",  # File encoding (utf-8, latin1, etc.)
+    "line_endings": "",  # unix, dos, or mac line endings
+}
+
+# Most outgoing requests held while Vim isn't reading them
+REQUEST_QUEUE_SIZE = 4096
+
+# Reported by tools whose request didn't fit in the full request queue
+BACKLOG_FULL = "Vim channel backlog full"
+
+# Batch requests are encoded as batch_prefix(method), the entries' JSON
+# without its brackets and BATCH_SUFFIX, so queued batches can be merged by
+# splicing their bytes
+BATCH_SUFFIX = b"]}}"
+
+# Result delivered to waiters whose reply will never arrive
+DISCONNECTED = ("disconnected", None)
+
+# Seconds close() waits for the socket thread to shut down
+SHUTDOWN_TIMEOUT = 1.0
+
+# Preallocated response slots; also the most requests that can await Vim at once
+RESPONSE_SLOTS = 64
+
+
+def batch_prefix(method: str) -> bytes:
+    """Bytes that start every encoded ``method`` batch request."""
+    return b'{"method":"%s","params":{"entries":[' % method.encode()
+
+
+def encode_batch(method: str, entries: list) -> bytes:
+    """Encode a ``method`` request carrying ``entries``.
+
+    Same JSON as encoding {"method": method, "params": {"entries": entries}},
+    laid out so that socket_server can merge batches without decoding them.
+    """
+    return batch_prefix(method) + json_codec.dumps(entries)[1:-1] + BATCH_SUFFIX
+
+
+class PendingResponse:
+    """Reusable slot for a single response from Vim.
+
+    The requesting thread waits on ``event``; the socket thread stores the
+    ``(response_type, data)`` tuple in ``result`` and then sets ``event``.
+    ``request_id`` is the counter value of the request that currently owns
+    the slot, or None while it is free.
+    """
+
+    __slots__ = ("event", "result", "request_id")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Optional[tuple] = None
+        self.request_id: Optional[int] = None
+
+
+class RequestQueue:
+    """Bounded FIFO of outgoing requests for the socket thread.
+
+    A deque guarded by one Condition: lighter than queue.Queue, which layers
+    three Conditions and task accounting on top of the same deque. Offers the
+    subset of the queue.Queue API used here (put/get/get_nowait, raising
+    queue.Empty), plus get_run_nowait() for merging back-to-back batches.
+    put() never blocks: once ``maxsize`` requests are waiting, for example
+    because Vim has stopped reading, it raises queue.Full.
+
+    put() also writes a byte to a self-pipe, so the socket thread can wait
+    for outgoing requests and incoming data in one selector call: register
+    ``wakeup_fd`` for reading and call clear_wakeup() before draining. Only
+    the first put() after each clear_wakeup() writes; later ones ride on the
+    wakeup already pending. close() closes the pipe and reopen() replaces it;
+    queued items survive both.
+
+    ``sequence`` counts every item ever put; put() returns the value it
+    assigned, so callers can tell whether anything was queued since.
+    """
+
+    __slots__ = (
+        "maxsize",
+        "sequence",
+        "_items",
+        "_not_empty",
+        "wakeup_fd",
+        "_wakeup_w",
+        "_wakeup_pending",
+    )
+
+    def __init__(self, maxsize: int = REQUEST_QUEUE_SIZE):
+        self.maxsize = maxsize
+        self.sequence = 0
+        self._items: deque = deque()
+        self._not_empty = threading.Condition(threading.Lock())
+        self.wakeup_fd = self._wakeup_w = -1
+        self._wakeup_pending = True
+        self.reopen()
+
+    def reopen(self) -> None:
+        """Create a fresh wakeup pipe if close() has closed it."""
+        with self._not_empty:
+            if self._wakeup_w >= 0:
+                return
+            self.wakeup_fd, self._wakeup_w = os.pipe()
+            os.set_blocking(self.wakeup_fd, False)
+            os.set_blocking(self._wakeup_w, False)
+            # Wake the new consumer if requests are already waiting
+            self._wakeup_pending = bool(self._items)
+            if self._wakeup_pending:
+                os.write(self._wakeup_w, b"\x01")
+
+    def close(self) -> None:
+        """Close the wakeup pipe; puts keep queueing but wake nobody."""
+        with self._not_empty:
+            if self._wakeup_w < 0:
+                return
+            os.close(self.wakeup_fd)
+            os.close(self._wakeup_w)
+            self.wakeup_fd = self._wakeup_w = -1
+            # Makes put() and wake() skip the write until reopen()
+            self._wakeup_pending = True
+
+    def put(self, item: Any) -> int:
+        """Append an item, wake one waiting consumer and return its sequence.
+
+        Raises queue.Full instead of blocking when the queue is at maxsize.
+        """
+        with self._not_empty:
+            if len(self._items) >= self.maxsize:
+                raise queue.Full(BACKLOG_FULL)
+            self._items.append(item)
+            self.sequence += 1
+            sequence = self.sequence
+            self._not_empty.notify()
+            # One byte per drain is enough; a burst of puts costs one write.
+            # Written under the lock so close() can't close the pipe under it.
+            if not self._wakeup_pending:
+                self._wakeup_pending = True
+                try:
+                    os.write(self._wakeup_w, b"\x01")
+                except BlockingIOError:
+                    pass  # Pipe full: a wakeup is already pending
+        return sequence
+
+    def wake(self) -> None:
+        """Wake the consumer without queueing anything, e.g. to stop it."""
+        with self._not_empty:
+            if self._wakeup_w < 0:
+                return  # Closed: nobody is waiting on the pipe
+            self._wakeup_pending = True
+            try:
+                os.write(self._wakeup_w, b"\x01")
+            except BlockingIOError:
+                pass  # Pipe full: a wakeup is already pending
+
+    def clear_wakeup(self) -> None:
+        """Consume pending wakeup bytes; call before draining the queue."""
+        try:
+            while os.read(self.wakeup_fd, 4096):
+                pass
+        except OSError:
+            pass  # Drained (BlockingIOError), or closed by close()
+        # Re-arm only after the pipe is empty: a put() that saw the flag set
+        # is then covered by the drain that follows this call
+        with self._not_empty:
+            if self._wakeup_w >= 0:
+                self._wakeup_pending = False
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """Remove and return the oldest item, blocking until one is available.
+
+        Raises queue.Empty if ``timeout`` expires first.
+        """
+        with self._not_empty:
+            if not self._not_empty.wait_for(lambda: self._items, timeout):
+                raise queue.Empty
+            return self._items.popleft()
+
+    def get_nowait(self) -> Any:
+        """Remove and return the oldest item, or raise queue.Empty."""
+        with self._not_empty:
+            if not self._items:
+                raise queue.Empty
+            return self._items.popleft()
+
+    def get_run_nowait(self, request_type: str, limit: int, max_bytes: int) -> list:
+        """Remove and return up to ``limit`` consecutive ``request_type``
+        requests at the head of the queue, oldest first; empty if the head is
+        another type.
+
+        Only requests whose data is already-encoded bytes are taken, and the
+        run stops before one that would bring their total size past
+        ``max_bytes``; it stays queued.
+        """
+        items = self._items
+        run = []
+        with self._not_empty:
+            while items and len(run) < limit:
+                head_type, data = items[0]
+                if head_type != request_type or type(data) is not bytes:
+                    break
+                max_bytes -= len(data)
+                if max_bytes < 0:
+                    break
+                run.append(items.popleft())
+        return run
+
+    def qsize(self) -> int:
+        """Return the number of queued items (approximate under contention)."""
+        return len(self._items)
 
 
 class VimState:
     """Thread-safe state manager for Vim editor connection and context.
 
     Thread-safe methods (use lock):
-    - update_context(): Updates editor context from Vim
-    - get_context(): Returns copy of current context
+    - ensure_started()/close(): Socket server lifecycle (uses _start_lock)
+    - register_response()/resolve_response()/release_response(): Track
+      requests waiting for a reply from Vim in a ring of preallocated slots
+    - enqueue_clear(): Queues a clear unless it repeats the previous request
+      (uses _clear_lock)
+    - cached_annotations()/store_annotations()/invalidate_annotations():
+      Short-lived cache of the last get_annotations result
+
+    Lock-free:
+    - update_context(): Publishes a new editor context snapshot from Vim
+    - get_context(): Returns the current context snapshot (read-only)
     - set_connected()/is_connected(): Manages connection state
+    - connected: The connection flag itself; read it directly on hot paths,
+      but only change it through set_connected()
 
-    Thread-safe without lock (queue.Queue is thread-safe):
+    Thread-safe without lock (RequestQueue is thread-safe):
     - request_queue: Outgoing requests to Vim
-    - response_queues: Incoming responses keyed by request_id
+    - enqueue()/enqueue_request(): Connection check and request_queue put in
+      one call
     """
 
+    # Fixed attribute set: no per-instance __dict__, and every tool call's
+    # attribute reads resolve through slot descriptors
+    __slots__ = (
+        "_lock",
+        "_start_lock",
+        "socket_server",
+        "server_thread",
+        "vim_channel",
+        "connected",
+        "request_queue",
+        "_slots",
+        "_next_request_id",
+        "_clear_lock",
+        "_last_clear",
+        "_annotations_cache",
+        "_annotations_generation",
+        "current_context",
+    )
+
     def __init__(self):
         self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
         self.socket_server: Optional[Any] = None
+        self.server_thread: Optional[threading.Thread] = None
         self.vim_channel: Optional[Any] = None
-        self.vim_connected = False
-        self.request_queue: queue.Queue = queue.Queue()
-        self.response_queues: Dict[str, queue.Queue] = {}
-        self.current_context: Dict[str, Any] = {
-            "context": "No context available",
-            "filename": "",
-            "line": 0,
-            "visual_start": 0,
-            "visual_end": 0,
-            "visual_start_col": 0,
-            "visual_end_col": 0,
-            "visual_start_line_len": 0,
-            "visual_end_line_len": 0,
-            "total_lines": 0,
-            "modified": False,
-            "encoding": "",
-            "line_endings": "",
-        }
+        self.connected = False
+        self.request_queue = RequestQueue()
+        self._slots = [PendingResponse() for _ in range(RESPONSE_SLOTS)]
+        self._next_request_id = itertools.count().__next__
+        self._clear_lock = threading.Lock()
+        self._last_clear: Optional[Tuple[str, Optional[str], int, float]] = None
+        self._annotations_cache: Optional[Tuple[tuple, float, str]] = None
+        self._annotations_generation = 0
+        self.current_context: Dict[str, Any] = dict(DEFAULT_CONTEXT)
+
+    def ensure_started(self) -> None:
+        """Start the socket server for this state; later calls do nothing.
+
+        Called from startup rather than on first tool use: Vim connects when
+        it starts, and tools refuse to run until it has.
+        """
+        with self._start_lock:
+            if self.socket_server is None:
+                self.request_queue.reopen()
+                # Imported here: socket_server's handlers import this module
+                from socket_server import start_socket_server
+
+                start_socket_server(self)
+
+    def close(self) -> None:
+        """Close the listening socket and the Vim connection, if open.
+
+        The socket thread is woken and does the closing itself, removing the
+        socket file too; this waits up to SHUTDOWN_TIMEOUT for it, then
+        closes whatever is still open and removes the file itself. Safe to call more than once;
+        ensure_started() can start a new server afterwards.
+        """
+        with self._start_lock:
+            server, self.socket_server = self.socket_server, None
+            thread, self.server_thread = self.server_thread, None
+            channel, self.vim_channel = self.vim_channel, None
+        if thread is not None and thread is not threading.current_thread():
+            # The thread sees socket_server no longer matches and shuts down
+            self.request_queue.wake()
+            thread.join(SHUTDOWN_TIMEOUT)
+            if not thread.is_alive():
+                server = channel = None
+        self.set_connected(False)
+        if channel is not None:
+            try:
+                channel.close()
+            except OSError:
+                pass
+        if server is not None:
+            # Imported here for the same reason as in ensure_started()
+            from socket_server import close_listener
+
+            close_listener(server)
+        self.request_queue.close()
 
     def update_context(self, context: Dict[str, Any]) -> None:
-        """Update the current editor context thread-safely."""
-        with self._lock:
-            self.current_context = context
+        """Publish a new editor context snapshot.
+
+        The dict is shared with readers from then on and must not be
+        mutated; build a new one for every update.
+        """
+        self.current_context = context
 
     def get_context(self) -> Dict[str, Any]:
-        """Get a copy of the current context thread-safely."""
-        with self._lock:
-            return self.current_context.copy()
+        """Get the current context snapshot.
+
+        Returns the shared dict without copying; treat it as read-only.
+        """
+        return self.current_context
 
     def set_connected(self, connected: bool) -> None:
-        """Set the connection state thread-safely."""
-        with self._lock:
-            self.vim_connected = connected
+        """Set the connection state (single atomic attribute store).
+
+        Going offline wakes every waiting request with DISCONNECTED, so tools
+        don't sit out their full timeout on a Vim that is gone, and drops
+        cached annotations, which a reconnected Vim may not have.
+        """
+        self.connected = connected
+        if not connected:
+            self.invalidate_annotations()
+            with self._lock:
+                for pending in self._slots:
+                    if pending.request_id is not None and not pending.event.is_set():
+                        pending.result = DISCONNECTED
+                        pending.event.set()
 
     def is_connected(self) -> bool:
-        """Check if Vim is connected thread-safely."""
+        """Check if Vim is connected (single atomic attribute read)."""
+        return self.connected
+
+    def enqueue(self, method: str, params: Dict[str, Any]) -> bool:
+        """Queue a fire-and-forget request to Vim if it is connected.
+
+        The message is encoded on the calling thread, so ``params`` (often a
+        caller-supplied entries list) is never shared with the socket thread.
+        Returns False without queueing anything when Vim is not connected, and
+        raises queue.Full if the request backlog is full.
+        """
+        if not self.connected:
+            return False
+        payload = json_codec.dumps({"method": method, "params": params})
+        self.request_queue.put((method, payload))
+        return True
+
+    def enqueue_request(
+        self, request: Tuple[str, Union[Dict[str, Any], bytes]]
+    ) -> bool:
+        """Queue a prebuilt ``(request_type, message)`` pair if Vim is connected.
+
+        ``message`` is a dict, or its JSON encoding as bytes.
+
+        Lets callers reuse constant messages; the message is shared and must
+        not be mutated. Returns False when Vim is not connected, and raises
+        queue.Full if the request backlog is full.
+        """
+        if not self.connected:
+            return False
+        self.request_queue.put(request)
+        return True
+
+    def register_response(self) -> Tuple[str, PendingResponse]:
+        """Claim a response slot for a new request.
+
+        Returns the request_id to send to Vim and the slot to wait on. Wait on
+        the slot's ``event``, read ``result``, then always call
+        release_response() with the same request_id.
+
+        IDs come from a counter and map onto a fixed ring of slots, so no
+        allocation happens per request. Raises RuntimeError if every slot is
+        still owned by an unreleased request.
+        """
+        with self._lock:
+            for _ in range(RESPONSE_SLOTS):
+                number = self._next_request_id()
+                pending = self._slots[number % RESPONSE_SLOTS]
+                if pending.request_id is None:
+                    pending.request_id = number
+                    pending.result = None
+                    pending.event.clear()
+                    return str(number), pending
+        raise RuntimeError("Too many requests waiting for Vim")
+
+    def _owned_slot(self, request_id: Optional[str]) -> Optional[PendingResponse]:
+        """Return the slot owned by ``request_id``, or None; call under _lock."""
+        try:
+            number = int(request_id)
+        except (TypeError, ValueError):
+            return None
+        pending = self._slots[number % RESPONSE_SLOTS]
+        return pending if pending.request_id == number else None
+
+    def resolve_response(self, request_id: Optional[str], result: tuple) -> bool:
+        """Deliver a reply from Vim to the waiting request.
+
+        Returns False if no request with that ID is waiting (e.g. it timed out).
+        """
+        with self._lock:
+            pending = self._owned_slot(request_id)
+            if pending is None:
+                return False
+            pending.result = result
+            pending.event.set()
+        return True
+
+    def release_response(self, request_id: str) -> None:
+        """Give a request's slot back to the ring for reuse."""
+        with self._lock:
+            pending = self._owned_slot(request_id)
+            if pending is not None:
+                # Under the lock, so a late reply can't land in a reused slot
+                pending.request_id = None
+                pending.result = None
+
+    def enqueue_clear(
+        self, request: Tuple[str, Dict[str, Any]], filename: Optional[str]
+    ) -> bool:
+        """Queue a clear request unless it repeats the request queued just before.
+
+        The clear is skipped, and True returned, when the last request queued
+        at all was the same clear for the same ``filename``, less than
+        CLEAR_DEDUP_WINDOW seconds ago. Anything queued in between, such as a
+        goto_line that changes the current buffer, means it is sent again.
+        Otherwise behaves like enqueue_request().
+        """
+        if not self.connected:
+            return False
+        op = request[0]
+        requests = self.request_queue
+        with self._clear_lock:
+            last = self._last_clear
+            now = time.monotonic()
+            if (
+                last is not None
+                and last[0] == op
+                and last[1] == filename
+                and last[2] == requests.sequence
+                and now - last[3] < CLEAR_DEDUP_WINDOW
+            ):
+                return True
+            self._last_clear = (op, filename, requests.put(request), now)
+            return True
+
+    def cached_annotations(self, key: tuple) -> Tuple[Optional[str], int]:
+        """Return the cached annotations for ``key`` and the cache generation.
+
+        The result is None unless the last stored result was for ``key`` and
+        is younger than ANNOTATIONS_CACHE_TTL. Pass the generation to
+        store_annotations() with the fresh result.
+        """
+        cached = self._annotations_cache
+        generation = self._annotations_generation
+        if (
+            cached is not None
+            and cached[0] == key
+            and time.monotonic() - cached[1] < ANNOTATIONS_CACHE_TTL
+        ):
+            return cached[2], generation
+        return None, generation
+
+    def store_annotations(self, key: tuple, generation: int, payload: str) -> None:
+        """Cache ``payload`` for ``key``; only the latest position is kept.
+
+        Skipped if annotations were invalidated since ``generation`` was read,
+        as the result may predate the change.
+        """
+        with self._lock:
+            if generation == self._annotations_generation:
+                self._annotations_cache = (key, time.monotonic(), payload)
+
+    def invalidate_annotations(self) -> None:
+        """Drop cached annotations; call after queuing anything that changes
+        Vim's annotation text props.
+        """
         with self._lock:
-            return self.vim_connected
+            self._annotations_generation += 1
+            self._annotations_cache = None